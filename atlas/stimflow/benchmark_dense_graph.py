@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Scaling benchmark for generate_dense_graph.py on a synthetic label volume.
+
+Builds a 1 mm MNI-like label volume (one Voronoi cell per base-graph region,
+clipped to a brain-sized ellipsoid) so the full 3.2k-500k node range runs
+without the real atlas, then drives the generator over a grid of
+--target-nodes x --knn x --min-micro-per-region with --profile and collects
+per-stage wall time, CPU time and peak RSS. Every output's schema is checked
+against the others (and against --baseline, when given).
+
+Usage:
+  python3 benchmark_dense_graph.py
+  python3 benchmark_dense_graph.py --targets 3200,51200 --knn 2,4 --out bench.json
+  python3 benchmark_dense_graph.py --baseline bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import nibabel as nib
+import numpy as np
+
+
+DEFAULT_TARGETS = [3200, 12800, 51200, 200000, 500000]
+# 1 mm grid with the MNI152 bounding box; origin at voxel (90, 126, 72).
+SYNTH_SHAPE = (181, 217, 181)
+SYNTH_AFFINE = np.array(
+    [
+        [-1.0, 0.0, 0.0, 90.0],
+        [0.0, 1.0, 0.0, -126.0],
+        [0.0, 0.0, 1.0, -72.0],
+        [0.0, 0.0, 0.0, 1.0],
+    ]
+)
+# Ellipsoid semi-axes (mm) and centre; ~2.2M labelled voxels.
+SYNTH_RADII = np.array([70.0, 100.0, 75.0])
+SYNTH_CENTRE = np.array([0.0, -18.0, 8.0])
+
+
+def parse_int_list(text: str) -> List[int]:
+    values = [int(part) for part in text.split(",") if part.strip()]
+    if not values:
+        raise argparse.ArgumentTypeError("expected a comma-separated list of integers")
+    return values
+
+
+def write_synthetic_atlas(base_nodes: List[dict], out_dir: Path) -> tuple[Path, Path]:
+    """Write a synthetic label NIfTI + ``code,name`` CSV for the base regions."""
+    codes = np.asarray([int(n["id"]) for n in base_nodes], dtype=np.int16)
+    centres = np.asarray([n["mni_mm"] for n in base_nodes], dtype=np.float32)
+    ij = np.indices(SYNTH_SHAPE[:2]).reshape(2, -1).T.astype(np.float32)
+    data = np.zeros(SYNTH_SHAPE, dtype=np.int16)
+    for k in range(SYNTH_SHAPE[2]):
+        vox = np.column_stack([ij, np.full(ij.shape[0], k, dtype=np.float32)])
+        mm = nib.affines.apply_affine(SYNTH_AFFINE, vox)
+        inside = (((mm - SYNTH_CENTRE) / SYNTH_RADII) ** 2).sum(axis=1) <= 1.0
+        if not inside.any():
+            continue
+        pts = mm[inside].astype(np.float32)
+        d2 = (pts * pts).sum(axis=1)[:, None] - 2.0 * (pts @ centres.T) + (centres * centres).sum(axis=1)[None, :]
+        plane = np.zeros(ij.shape[0], dtype=np.int16)
+        plane[inside] = codes[np.argmin(d2, axis=1)]
+        data[:, :, k] = plane.reshape(SYNTH_SHAPE[:2])
+
+    atlas_path = out_dir / "synthetic_atlas.nii.gz"
+    labels_path = out_dir / "synthetic_labels.csv"
+    nib.save(nib.Nifti1Image(data, SYNTH_AFFINE), str(atlas_path))
+    labels_path.write_text("".join(f"{n['id']},{n['name']}\n" for n in base_nodes))
+    return atlas_path, labels_path
+
+
+def value_type(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, list):
+        return "list[" + ",".join(sorted({value_type(v) for v in value})) + "]"
+    return type(value).__name__
+
+
+def graph_schema(graph: dict) -> dict:
+    """Key/type signature of a dense graph, per node kind and for edges."""
+    nodes: Dict[str, Dict[str, str]] = {}
+    for node in graph["nodes"]:
+        sig = nodes.setdefault(node.get("kind", "?"), {})
+        for key, value in node.items():
+            sig.setdefault(key, value_type(value))
+    edges: Dict[str, str] = {}
+    for edge in graph["edges"]:
+        for key, value in edge.items():
+            edges.setdefault(key, value_type(value))
+    return {
+        "top_level": sorted(graph),
+        "atlas": {key: value_type(value) for key, value in sorted(graph["atlas"].items())},
+        "nodes": {kind: dict(sorted(sig.items())) for kind, sig in sorted(nodes.items())},
+        "edges": dict(sorted(edges.items())),
+    }
+
+
+def run_case(
+    generator: Path,
+    base_graph: Path,
+    atlas_path: Path,
+    labels_path: Path,
+    work_dir: Path,
+    target_nodes: int,
+    knn: int,
+    min_micro: int,
+    workers: int,
+) -> dict:
+    out_path = work_dir / f"dense_{target_nodes}_k{knn}_m{min_micro}.json"
+    cmd = [
+        sys.executable,
+        str(generator),
+        "--base-graph",
+        str(base_graph),
+        "--atlas",
+        str(atlas_path),
+        "--labels",
+        str(labels_path),
+        "--out",
+        str(out_path),
+        "--target-nodes",
+        str(target_nodes),
+        "--knn",
+        str(knn),
+        "--min-micro-per-region",
+        str(min_micro),
+        "--workers",
+        str(workers),
+        "--cache-dir",
+        "",
+        "--profile",
+    ]
+    t0 = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    wall_s = time.perf_counter() - t0
+
+    profile = json.loads(out_path.with_suffix(".profile.json").read_text())
+    graph = json.loads(out_path.read_text())
+    result = {
+        "target_nodes": target_nodes,
+        "knn": knn,
+        "min_micro_per_region": min_micro,
+        "workers": workers,
+        "nodes": len(graph["nodes"]),
+        "edges": len(graph["edges"]),
+        "output_bytes": out_path.stat().st_size,
+        "wall_s": round(wall_s, 3),
+        "generator_wall_s": profile["wall_s"],
+        "peak_rss_mb": profile["peak_rss_mb"],
+        "stages": profile["totals"],
+        "schema": graph_schema(graph),
+    }
+    del graph
+    out_path.unlink()
+    out_path.with_suffix(".profile.json").unlink()
+    return result
+
+
+def case_key(result: dict) -> tuple:
+    return (result["target_nodes"], result["knn"], result["min_micro_per_region"])
+
+
+def main() -> int:
+    root = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description="Dense graph generator scaling benchmark")
+    parser.add_argument(
+        "--targets",
+        type=parse_int_list,
+        default=DEFAULT_TARGETS,
+        help="Comma-separated --target-nodes values",
+    )
+    parser.add_argument("--knn", type=parse_int_list, default=[2], help="Comma-separated --knn values")
+    parser.add_argument(
+        "--min-micro",
+        type=parse_int_list,
+        default=[8],
+        help="Comma-separated --min-micro-per-region values",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Generator --workers for every run")
+    parser.add_argument(
+        "--base-graph",
+        type=Path,
+        default=root.parent / "assets" / "aal_graph.json",
+        help="Base 116-node graph JSON (regions of the synthetic volume)",
+    )
+    parser.add_argument("--out", type=Path, help="Write results JSON here")
+    parser.add_argument("--baseline", type=Path, help="Earlier results JSON to compare schema and timings against")
+    args = parser.parse_args()
+
+    base_nodes = json.loads(args.base_graph.read_text())["nodes"]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="stimflow-bench-") as tmp:
+        work_dir = Path(tmp)
+        atlas_path, labels_path = write_synthetic_atlas(base_nodes, work_dir)
+        for target_nodes in args.targets:
+            for knn in args.knn:
+                for min_micro in args.min_micro:
+                    result = run_case(
+                        root / "generate_dense_graph.py",
+                        args.base_graph,
+                        atlas_path,
+                        labels_path,
+                        work_dir,
+                        target_nodes,
+                        knn,
+                        min_micro,
+                        args.workers,
+                    )
+                    results.append(result)
+                    stages = " ".join(f"{name}={tot['wall_s']:.2f}s" for name, tot in result["stages"].items())
+                    print(
+                        f"target={target_nodes} knn={knn} min={min_micro}: "
+                        f"{result['nodes']} nodes, {result['edges']} edges, "
+                        f"{result['wall_s']:.2f}s, peak {result['peak_rss_mb']:.0f} MiB | {stages}"
+                    )
+
+    ok = True
+    schema = results[0]["schema"] if results else None
+    for result in results:
+        if result["schema"] != schema:
+            print(f"FAIL: schema differs for target={result['target_nodes']} knn={result['knn']}")
+            ok = False
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        if schema is not None and baseline.get("schema") != schema:
+            print("FAIL: output schema differs from baseline")
+            print(json.dumps({"baseline": baseline.get("schema"), "current": schema}, indent=2))
+            ok = False
+        previous = {case_key(r): r for r in baseline.get("runs", [])}
+        for result in results:
+            before = previous.get(case_key(result))
+            if before is None:
+                continue
+            print(
+                f"target={result['target_nodes']} knn={result['knn']} min={result['min_micro_per_region']}: "
+                f"wall {before['wall_s']:.2f}s -> {result['wall_s']:.2f}s "
+                f"({result['wall_s'] / max(before['wall_s'], 1e-9):.2f}x), "
+                f"peak {before['peak_rss_mb']:.0f} -> {result['peak_rss_mb']:.0f} MiB"
+            )
+
+    if args.out is not None:
+        runs = [{k: v for k, v in r.items() if k != "schema"} for r in results]
+        args.out.write_text(json.dumps({"schema": schema, "runs": runs}, indent=2) + "\n")
+        print(f"Wrote {args.out}")
+
+    if ok:
+        print("PASS: output schema stable across runs")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,10 +9,18 @@ Generate a dense AAL graph (thousands of anatomically placed nodes) by:
 from __future__ import annotations
 
 import argparse
+import gzip
 import hashlib
+import io
 import json
+import os
+import sys
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Tuple
 
 import nibabel as nib
 import numpy as np
@@ -23,17 +31,345 @@ def stable_seed(text: str) -> int:
     return int(digest[:16], 16) & 0xFFFFFFFF
 
 
-def load_label_map(csv_path: Path) -> Dict[str, int]:
+DEFAULT_ATLAS = "net/aal/aal.nii.gz"
+DEFAULT_LABELS = "net/aal/aal_labels.csv"
+DEFAULT_ATLAS_ARCHIVE = "net/aal/_raw/aal_for_SPM12.tar.gz"
+ARCHIVE_ATLAS_MEMBER = "aal/ROI_MNI_V4.nii"
+ARCHIVE_LABELS_MEMBER = "aal/ROI_MNI_V4.txt"
+# Bump whenever sampling changes output, to invalidate cached node samples. Build
+# stamps also key on this file's own source, so wiring changes never need a bump.
+GENERATOR_VERSION = 1
+
+
+def parse_label_map(text: str) -> Dict[str, int]:
+    """Parse ``code,name`` CSV lines or AAL ``ROI_MNI_V4.txt`` (abbrev, name, code) rows."""
     out: Dict[str, int] = {}
-    for raw in csv_path.read_text().splitlines():
+    for raw in text.splitlines():
         line = raw.strip()
         if not line or line.startswith("#"):
             continue
-        code, name = line.split(",", 1)
+        if "," in line:
+            code, name = line.split(",", 1)
+        else:
+            _, name, code = line.split()
         out[name.strip()] = int(code.strip())
     return out
 
 
+def load_label_map(csv_path: Path) -> Dict[str, int]:
+    return parse_label_map(csv_path.read_text())
+
+
+def is_archive(path: Path) -> bool:
+    return path.name.endswith((".tar.gz", ".tgz", ".tar"))
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_archive_members(archive: Path, members: Sequence[str]) -> Dict[str, bytes]:
+    """Stream ``members`` out of a tarball in one forward pass, gunzipping ``*.gz``."""
+    wanted = set(members)
+    out: Dict[str, bytes] = {}
+    with tarfile.open(archive, "r|*") as tar:
+        for info in tar:
+            if info.name not in wanted or not info.isfile():
+                continue
+            data = tar.extractfile(info).read()
+            out[info.name] = gzip.decompress(data) if info.name.endswith(".gz") else data
+            if len(out) == len(wanted):
+                break
+    missing = wanted - set(out)
+    if missing:
+        raise RuntimeError(f"{archive} is missing members: {sorted(missing)}")
+    return out
+
+
+def digest_json(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def temp_path(path: Path) -> Path:
+    """Per-process sibling of ``path`` to write before renaming into place."""
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    tmp = temp_path(path)
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def save_region_samples(path: Path, names: List[str], region_coords: Dict[str, np.ndarray]) -> None:
+    """Cache sampled micro-node coordinates (not kNN tables) for one level."""
+    buf = io.BytesIO()
+    np.savez(
+        buf,
+        counts=np.asarray([region_coords[name].shape[0] for name in names], dtype=np.int64),
+        coords=np.concatenate([region_coords[name].reshape(-1, 3) for name in names]),
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, buf.getvalue())
+
+
+def load_region_samples(path: Path, names: List[str]) -> Dict[str, np.ndarray] | None:
+    if not path.exists():
+        return None
+    with np.load(path) as cached:
+        counts = cached["counts"]
+        coords = cached["coords"]
+    if counts.size != len(names):
+        return None
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    return {name: coords[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+
+
+def output_stamp(paths: Sequence[Path]) -> Dict[str, List[int]] | None:
+    stamp = {}
+    for path in paths:
+        if not path.exists():
+            return None
+        st = path.stat()
+        stamp[str(path)] = [st.st_size, st.st_mtime_ns]
+    return stamp
+
+
+def load_archive_inputs(
+    archive: Path,
+    atlas_member: str,
+    labels_member: str,
+    cache_dir: Path | None,
+) -> Tuple[nib.Nifti1Image, Dict[str, int]]:
+    """Atlas image and label map from a packed AAL tarball, cached decoded by content hash."""
+    if cache_dir is not None:
+        digest = file_digest(archive)[:16]
+        atlas_cached = cache_dir / f"atlas-{digest}-{Path(atlas_member).name.split('.')[0]}.nii"
+        labels_cached = cache_dir / f"labels-{digest}-{Path(labels_member).name.split('.')[0]}.csv"
+        if atlas_cached.exists() and labels_cached.exists():
+            return nib.load(str(atlas_cached), keep_file_open=True), load_label_map(labels_cached)
+
+    blobs = read_archive_members(archive, [atlas_member, labels_member])
+    img = nib.Nifti1Image.from_bytes(blobs[atlas_member])
+    label_to_code = parse_label_map(blobs[labels_member].decode("latin-1"))
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        write_atomic(atlas_cached, blobs[atlas_member])
+        csv = "".join(f"{code},{name}\n" for name, code in label_to_code.items())
+        write_atomic(labels_cached, csv.encode("utf-8"))
+    return img, label_to_code
+
+
+def label_slab(block) -> np.ndarray:
+    """Integer labels for one slab; scaled (float) proxies are rounded back to codes."""
+    block = np.asarray(block)
+    if not np.issubdtype(block.dtype, np.integer):
+        block = np.rint(block).astype(np.int64)
+    return block
+
+
+def group_label_voxels(data, codes: List[int], slab_voxels: int = 1 << 22) -> Dict[int, np.ndarray]:
+    """Group voxel coordinates by label code, reading the volume in slabs of whole slices."""
+    # Each code maps to a (k, 3) array in np.argwhere(data == code) order.
+    shape = tuple(int(d) for d in data.shape[:3])
+    wanted = np.unique(np.asarray(codes, dtype=np.int64))
+    slab = max(1, slab_voxels // max(1, shape[0] * shape[1]))
+
+    hit_chunks: List[np.ndarray] = []
+    label_chunks: List[np.ndarray] = []
+    for z0 in range(0, shape[2], slab):
+        z1 = min(shape[2], z0 + slab)
+        block = label_slab(data[:, :, z0:z1])
+        local = np.flatnonzero(np.isin(block, wanted))
+        if local.size == 0:
+            continue
+        i, j, k = np.unravel_index(local, block.shape)
+        hit_chunks.append(np.ravel_multi_index((i, j, k + z0), shape))
+        label_chunks.append(block.ravel()[local].astype(np.int64))
+
+    hits = np.concatenate(hit_chunks) if hit_chunks else np.empty(0, dtype=np.int64)
+    labels = np.concatenate(label_chunks) if label_chunks else np.empty(0, dtype=np.int64)
+    order = np.lexsort((hits, labels))
+    hits = hits[order]
+    labels = labels[order]
+    coords = np.column_stack(np.unravel_index(hits, shape))
+    lo = np.searchsorted(labels, wanted, side="left")
+    hi = np.searchsorted(labels, wanted, side="right")
+    return {int(code): coords[a:b] for code, a, b in zip(wanted, lo, hi)}
+
+
+def knn_indices(coords: np.ndarray, k: int, pair_budget: int = 1 << 21) -> np.ndarray:
+    """Exact batched k-nearest neighbours (excluding self), ordered by (distance, index)."""
+    # Each query answers from its 27-cell grid neighbourhood; its cell grows when too few
+    # candidates are found and shrinks when too many, so cells follow local density.
+    m = coords.shape[0]
+    k = max(0, min(k, m - 1))
+    out = np.empty((m, k), dtype=np.int64)
+    if k == 0:
+        return out
+
+    pts = np.asarray(coords, dtype=np.float64)
+    lo = pts.min(axis=0)
+    span = pts.max(axis=0) - lo
+    max_span = float(span.max())
+    vol = float(np.prod(np.maximum(span, max_span / m)))
+    # Cell sizes are base_cell * 1.26**level (each level doubles the volume).
+    base_cell = max(0.25 * float(np.cbrt(vol * (k + 1) / m)), max_span / m, 1e-9)
+    min_level = int(np.floor(np.log(max(max_span * 1e-6, 1e-9) / base_cell) / np.log(1.26)))
+    min_candidates = min(m, 6 * (k + 1))
+    max_candidates = 64 * (k + 1)
+    level = np.zeros(m, dtype=np.int64)
+    # Highest level each query was found too sparse (or unresolved) at; it never shrinks to it again.
+    floor = np.full(m, min_level - 1, dtype=np.int64)
+    offsets = np.array(
+        [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)],
+        dtype=np.int64,
+    )
+
+    pending = np.arange(m)
+    while pending.size:
+        lvl = int(level[pending].min())
+        cell = base_cell * 1.26**lvl
+        at_level = level[pending] == lvl
+        deferred = [pending[~at_level]]
+        pending = pending[at_level]
+
+        scaled = (pts - lo) / cell
+        ijk = np.floor(scaled).astype(np.int64) + 1
+        dims = ijk.max(axis=0) + 2
+        keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+        order = np.argsort(keys, kind="stable")
+        sorted_pts = pts[order]
+        key_offsets = (offsets[:, 0] * dims[1] + offsets[:, 1]) * dims[2] + offsets[:, 2]
+        q_keys = keys[pending][:, None] + key_offsets[None, :]
+        n_cells = int(np.prod(dims))
+        if n_cells <= 32 * m + 4096:
+            occupancy = np.bincount(keys, minlength=n_cells)
+            counts = occupancy[q_keys]
+            starts = np.cumsum(occupancy)[q_keys] - counts
+        else:
+            sorted_keys = keys[order]
+            starts = np.searchsorted(sorted_keys, q_keys, side="left")
+            counts = np.searchsorted(sorted_keys, q_keys, side="right") - starts
+        row_len = counts.sum(axis=1)
+        sparse = row_len < min_candidates
+        crowded = (row_len > max_candidates) & (floor[pending] < lvl - 1)
+        grow = pending[sparse]
+        level[grow] = lvl + 1
+        floor[grow] = lvl
+        shrink = pending[crowded]
+        level[shrink] = np.maximum(lvl - 3, floor[shrink] + 1)
+        ready = ~sparse & ~crowded
+        deferred += [grow, shrink]
+
+        # Block queries of similar neighbourhood size into padded (rows, width) arrays.
+        by_len = np.flatnonzero(ready)[np.argsort(row_len[ready], kind="stable")]
+        begin = 0
+        while begin < by_len.size:
+            span_rows = max(1, pair_budget // max(1, int(row_len[by_len[begin]])))
+            width_cap = row_len[by_len[begin:begin + span_rows]]
+            fits = np.arange(1, width_cap.size + 1) * width_cap <= pair_budget
+            end = begin + max(1, int(np.count_nonzero(fits)))
+            block = by_len[begin:end]
+            begin = end
+
+            queries = pending[block]
+            b_counts = counts[block].ravel()
+            b_starts = starts[block].ravel()
+            lens = row_len[block]
+            width = int(lens.max())
+            total = int(lens.sum())
+            row_of = np.repeat(np.arange(block.size), lens)
+            col_of = np.arange(total) - np.repeat(np.cumsum(lens) - lens, lens)
+            run_starts = np.repeat(b_starts - (np.cumsum(b_counts) - b_counts), b_counts)
+            slots = run_starts + np.arange(total)
+            cand = order[slots]
+            delta = sorted_pts[slots] - np.repeat(pts[queries], lens, axis=0)
+            dist2 = np.einsum("ij,ij->i", delta, delta)
+            dist2[cand == np.repeat(queries, lens)] = np.inf
+
+            dmat = np.full((block.size, width), np.inf)
+            dmat[row_of, col_of] = dist2
+            cmat = np.full((block.size, width), m, dtype=np.int64)
+            cmat[row_of, col_of] = cand
+
+            kth = np.partition(dmat, k - 1, axis=1)[:, k - 1]
+            lens_bound = 1.0 + np.minimum(
+                scaled[queries] - np.floor(scaled[queries]),
+                np.ceil(scaled[queries]) - scaled[queries],
+            ).min(axis=1)
+            resolved = kth <= (cell * lens_bound) ** 2
+            retry = queries[~resolved]
+            level[retry] = lvl + 1
+            floor[retry] = lvl
+            deferred.append(retry)
+            if not resolved.any():
+                continue
+
+            dmat = dmat[resolved]
+            cmat = cmat[resolved]
+            kth = kth[resolved][:, None]
+            # Everything strictly closer than the k-th distance is kept; ties at
+            # the k-th distance go to the lowest indices.
+            rank_key = np.where(dmat < kth, -1, np.where(dmat == kth, cmat, m + 1))
+            pick = np.argpartition(rank_key, k - 1, axis=1)[:, :k]
+            pick_d = np.take_along_axis(dmat, pick, axis=1)
+            pick_c = np.take_along_axis(cmat, pick, axis=1)
+            sort = np.lexsort((pick_c, pick_d), axis=-1)
+            out[queries[resolved]] = np.take_along_axis(pick_c, sort, axis=1)
+
+        pending = np.concatenate(deferred)
+    return out
+
+
+class EdgeBuffer:
+    """Preallocated undirected edge arrays, reduced to one max-weight row per pair."""
+
+    def __init__(self, capacity: int = 1024) -> None:
+        capacity = max(1, int(capacity))
+        self.src = np.empty(capacity, dtype=np.int64)
+        self.dst = np.empty(capacity, dtype=np.int64)
+        self.weight = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def add(self, src, dst, weight) -> None:
+        src, dst, weight = np.broadcast_arrays(
+            np.asarray(src, dtype=np.int64),
+            np.asarray(dst, dtype=np.int64),
+            np.asarray(weight, dtype=np.float64),
+        )
+        count = src.size
+        end = self.size + count
+        if end > self.src.size:
+            grown = max(end, 2 * self.src.size)
+            self.src = np.resize(self.src, grown)
+            self.dst = np.resize(self.dst, grown)
+            self.weight = np.resize(self.weight, grown)
+        self.src[self.size:end] = src.ravel()
+        self.dst[self.size:end] = dst.ravel()
+        self.weight[self.size:end] = weight.ravel()
+        self.size = end
+
+    def reduce(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (source, target, weight) sorted by (source, target), source < target."""
+        a = self.src[: self.size]
+        b = self.dst[: self.size]
+        keep = a != b
+        s = np.minimum(a, b)[keep]
+        t = np.maximum(a, b)[keep]
+        w = np.clip(self.weight[: self.size][keep], 0.0, 1.0)
+        order = np.lexsort((w, t, s))
+        s, t, w = s[order], t[order], w[order]
+        last = np.ones(s.size, dtype=bool)
+        last[:-1] = (s[1:] != s[:-1]) | (t[1:] != t[:-1])
+        return s[last], t[last], w[last]
+
+
 def allocate_micro_nodes(
     region_names: List[str],
     voxel_counts: Dict[str, int],
@@ -79,84 +415,151 @@ def allocate_micro_nodes(
     return alloc
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--base-graph",
-        default="model/assets/aal_graph.json",
-        help="Base 116-node graph JSON",
-    )
-    parser.add_argument(
-        "--atlas",
-        default="net/aal/aal.nii.gz",
-        help="AAL atlas NIfTI path",
-    )
-    parser.add_argument(
-        "--labels",
-        default="net/aal/aal_labels.csv",
-        help="AAL labels CSV path",
-    )
-    parser.add_argument(
-        "--out",
-        default="model/assets/aal_graph_dense.json",
-        help="Output dense graph JSON",
-    )
-    parser.add_argument(
-        "--target-nodes",
-        type=int,
-        default=3200,
-        help="Target total nodes including 116 core nodes",
-    )
-    parser.add_argument(
-        "--min-micro-per-region",
-        type=int,
-        default=8,
-        help="Minimum sampled micro nodes per region",
-    )
-    parser.add_argument(
-        "--knn",
-        type=int,
-        default=2,
-        help="Intra-region nearest neighbors per micro node",
-    )
-    args = parser.parse_args()
+PACKED_FORMAT = "stimflow-packed-graph"
+PACKED_VERSION = 1
 
-    base_graph_path = Path(args.base_graph)
-    atlas_path = Path(args.atlas)
-    labels_path = Path(args.labels)
-    out_path = Path(args.out)
 
-    base_graph = json.loads(base_graph_path.read_text())
-    base_nodes = base_graph["nodes"]
-    base_edges = base_graph["edges"]
+def packed_paths(out_path: Path) -> Tuple[Path, Path]:
+    """Binary payload and JSON sidecar paths for a packed twin of ``out_path``."""
+    return out_path.with_suffix(".bin"), out_path.with_suffix(".meta.json")
 
-    label_to_code = load_label_map(labels_path)
-    base_names = [n["name"] for n in base_nodes]
-    missing = [name for name in base_names if name not in label_to_code]
-    if missing:
-        raise RuntimeError(f"Missing label codes for: {missing[:8]}")
 
-    img = nib.load(str(atlas_path))
-    data = img.get_fdata().astype(np.int32)
-    affine = img.affine
-
-    region_voxels: Dict[str, np.ndarray] = {}
-    voxel_counts: Dict[str, int] = {}
-    for name in base_names:
-        code = label_to_code[name]
-        vox = np.argwhere(data == code)
-        region_voxels[name] = vox
-        voxel_counts[name] = int(vox.shape[0])
-
-    core_count = len(base_nodes)
-    target_micro = max(0, args.target_nodes - core_count)
-    micro_alloc = allocate_micro_nodes(
-        region_names=base_names,
-        voxel_counts=voxel_counts,
-        target_micro_total=target_micro,
-        min_per_region=max(0, args.min_micro_per_region),
-    )
+def write_packed_graph(
+    out_path: Path,
+    atlas_meta: dict,
+    base_nodes: List[dict],
+    nodes: List[dict],
+    edge_src: np.ndarray,
+    edge_dst: np.ndarray,
+    edge_weight_norm: Sequence[float],
+    parents: np.ndarray | None = None,
+    csr: Tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+) -> Tuple[Path, Path]:
+    """Write the graph as 8-byte-aligned little-endian typed arrays plus a JSON sidecar."""
+    bin_path, meta_path = packed_paths(out_path)
+    region_of = {n["name"]: i for i, n in enumerate(base_nodes)}
+    region = np.asarray([region_of[n.get("region", n["name"])] for n in nodes], dtype="<u2")
+    arrays = [("weight_norm", np.asarray(edge_weight_norm, dtype="<f8"))]
+    if csr is not None:
+        arrays.append(("csr_weights", np.asarray(csr[2], dtype="<f8")))
+    arrays += [
+        ("mni_mm", np.asarray([n["mni_mm"] for n in nodes], dtype="<f4").reshape(-1)),
+        ("volume_mm3", np.asarray([n["volume_mm3"] for n in nodes], dtype="<f4")),
+        ("source", np.asarray(edge_src, dtype="<u4")),
+        ("target", np.asarray(edge_dst, dtype="<u4")),
+    ]
+    if parents is not None:
+        arrays.append(("parent", np.asarray(parents, dtype="<u4")))
+    if csr is not None:
+        label_counts = np.bincount(region, minlength=len(base_nodes))
+        arrays += [
+            ("csr_offsets", np.asarray(csr[0], dtype="<u4")),
+            ("csr_neighbors", np.asarray(csr[1], dtype="<u4")),
+            ("label_nodes", np.argsort(region, kind="stable").astype("<u4")),
+            ("label_offsets", np.concatenate([[0], np.cumsum(label_counts)]).astype("<u4")),
+        ]
+    arrays.append(("region", region))
+
+    layout = {}
+    offset = 0
+    tmp = temp_path(bin_path)
+    with tmp.open("wb") as f:
+        for key, arr in arrays:
+            pad = (-offset) % 8
+            f.write(b"\0" * pad)
+            offset += pad
+            layout[key] = {"dtype": arr.dtype.name, "offset": offset, "count": int(arr.size)}
+            f.write(arr.tobytes())
+            offset += arr.nbytes
+    os.replace(tmp, bin_path)
+
+    meta = {
+        "format": PACKED_FORMAT,
+        "version": PACKED_VERSION,
+        "graph_file": out_path.name,
+        "binary": bin_path.name,
+        "atlas": atlas_meta,
+        "node_count": len(nodes),
+        "edge_count": int(len(edge_src)),
+        "core_count": len(base_nodes),
+        "regions": {
+            "id": [n["id"] for n in base_nodes],
+            "name": [n["name"] for n in base_nodes],
+            "hemisphere": [n.get("hemisphere", "U") for n in base_nodes],
+        },
+        "arrays": layout,
+    }
+    write_atomic(meta_path, json.dumps(meta, separators=(",", ":")).encode("utf-8"))
+    return bin_path, meta_path
 
+
+def load_region_voxels(
+    img: nib.Nifti1Image,
+    label_to_code: Dict[str, int],
+    base_names: List[str],
+    slab_voxels: int = 1 << 22,
+) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Scan the atlas once and return per-region voxel coordinates plus the affine."""
+    codes = [label_to_code[name] for name in base_names]
+    code_voxels = group_label_voxels(img.dataobj, codes, slab_voxels)
+    region_voxels = {name: code_voxels[label_to_code[name]] for name in base_names}
+    return region_voxels, img.affine
+
+
+def sample_region(task: Tuple[str, np.ndarray, int, np.ndarray]) -> np.ndarray:
+    """Sample one region's micro nodes as MNI coordinates (m, 3) from its own seed."""
+    name, vox, want, affine = task
+    if want <= 0 or vox.shape[0] == 0:
+        return np.empty((0, 3))
+
+    rng = np.random.default_rng(stable_seed(name))
+    if want >= vox.shape[0]:
+        picked = vox
+    else:
+        sel = rng.choice(vox.shape[0], size=want, replace=False)
+        picked = vox[sel]
+
+    return nib.affines.apply_affine(affine, picked.astype(np.float32))
+
+
+def region_knn(task: Tuple[np.ndarray, int]) -> np.ndarray:
+    """Region-local kNN table (m, k) over one region's sampled coordinates."""
+    coords_mm, knn = task
+    m = coords_mm.shape[0]
+    if m <= 1:
+        return np.empty((m, 0), dtype=np.int64)
+    # kNN local links (grid-hashed, region-local only; ties broken by index).
+    return knn_indices(coords_mm.astype(np.float32), max(1, min(knn, m - 1)))
+
+
+def sample_regions(
+    base_nodes: List[dict],
+    region_voxels: Dict[str, np.ndarray],
+    affine: np.ndarray,
+    micro_alloc: Dict[str, int],
+    pool: ProcessPoolExecutor | None = None,
+) -> Dict[str, np.ndarray]:
+    names = [n["name"] for n in base_nodes]
+    tasks = [(name, region_voxels[name], micro_alloc[name], affine) for name in names]
+    mapper = pool.map if pool is not None else map
+    return dict(zip(names, mapper(sample_region, tasks)))
+
+
+def knn_tables(
+    region_coords: Dict[str, np.ndarray],
+    knn: int,
+    pool: ProcessPoolExecutor | None = None,
+) -> Dict[str, np.ndarray]:
+    names = list(region_coords)
+    mapper = pool.map if pool is not None else map
+    return dict(zip(names, mapper(region_knn, [(region_coords[name], knn) for name in names])))
+
+
+def sample_nodes(
+    base_nodes: List[dict],
+    region_coords: Dict[str, np.ndarray],
+    micro_alloc: Dict[str, int],
+) -> Tuple[List[dict], Dict[str, dict]]:
     nodes: List[dict] = []
     region_info: Dict[str, dict] = {}
 
@@ -184,20 +587,9 @@ def main() -> None:
         }
 
     next_idx = len(nodes)
-    for name in base_names:
-        vox = region_voxels[name]
-        want = micro_alloc[name]
-        if want <= 0 or vox.shape[0] == 0:
-            continue
-
-        rng = np.random.default_rng(stable_seed(name))
-        if want >= vox.shape[0]:
-            picked = vox
-        else:
-            sel = rng.choice(vox.shape[0], size=want, replace=False)
-            picked = vox[sel]
-
-        coords_mm = nib.affines.apply_affine(affine, picked.astype(np.float32))
+    for n in base_nodes:
+        name = n["name"]
+        coords_mm = region_coords[name]
         per_node_vol = region_info[name]["per_node_vol"]
 
         for j, xyz in enumerate(coords_mm, start=1):
@@ -216,51 +608,48 @@ def main() -> None:
             region_info[name]["micro_coords"].append((float(xyz[0]), float(xyz[1]), float(xyz[2])))
             next_idx += 1
 
-    edge_w: Dict[Tuple[int, int], float] = {}
+    return nodes, region_info
 
-    def add_edge(a: int, b: int, w: float) -> None:
-        if a == b:
-            return
-        s, t = (a, b) if a < b else (b, a)
-        w = float(np.clip(w, 0.0, 1.0))
-        prev = edge_w.get((s, t))
-        if prev is None or w > prev:
-            edge_w[(s, t)] = w
-
-    # Intra-region dense links.
-    for name in base_names:
-        info = region_info[name]
+
+def new_edge_buffer(region_info: Dict[str, dict], region_knn: Dict[str, np.ndarray], base_edges: List[dict]) -> EdgeBuffer:
+    return EdgeBuffer(
+        sum(3 * len(info["micro_indices"]) + region_knn[name].size for name, info in region_info.items())
+        + 9 * len(base_edges)
+    )
+
+
+def wire_intra_region(
+    edge_buf: EdgeBuffer,
+    base_nodes: List[dict],
+    region_info: Dict[str, dict],
+    region_knn: Dict[str, np.ndarray],
+) -> None:
+    """Core spokes, a guaranteed ring and kNN links inside every region."""
+    for n in base_nodes:
+        info = region_info[n["name"]]
         core_idx = info["core_idx"]
-        micro_idx = info["micro_indices"]
-        coords = np.array(info["micro_coords"], dtype=np.float32)
+        micro_idx = np.asarray(info["micro_indices"], dtype=np.int64)
         m = len(micro_idx)
         if m == 0:
             continue
 
-        for mi in micro_idx:
-            add_edge(core_idx, mi, 0.34)
+        edge_buf.add(core_idx, micro_idx, 0.34)
 
         if m > 1:
             # Ring for guaranteed local connectivity.
-            for i in range(m):
-                add_edge(micro_idx[i], micro_idx[(i + 1) % m], 0.21)
-
-            # kNN local links (deterministic brute-force, region-local only).
-            k = max(1, min(args.knn, m - 1))
-            for i in range(m):
-                delta = coords - coords[i]
-                dist2 = np.einsum("ij,ij->i", delta, delta)
-                order = np.argsort(dist2)
-                added = 0
-                for j in order:
-                    if j == i:
-                        continue
-                    add_edge(micro_idx[i], micro_idx[int(j)], 0.18)
-                    added += 1
-                    if added >= k:
-                        break
-
-    # Inter-region links from base graph + additional bridge samples.
+            edge_buf.add(micro_idx, np.roll(micro_idx, -1), 0.21)
+
+            neighbours = region_knn[n["name"]]
+            edge_buf.add(np.repeat(micro_idx, neighbours.shape[1]), micro_idx[neighbours.ravel()], 0.18)
+
+
+def wire_bridges(
+    edge_buf: EdgeBuffer,
+    base_nodes: List[dict],
+    base_edges: List[dict],
+    region_info: Dict[str, dict],
+) -> None:
+    """Inter-region links from the base graph plus additional bridge samples."""
     for e in base_edges:
         src_name = base_nodes[e["source"]]["name"]
         dst_name = base_nodes[e["target"]]["name"]
@@ -268,7 +657,7 @@ def main() -> None:
         dst_info = region_info[dst_name]
         w = float(e.get("weight_norm", 0.0))
 
-        add_edge(src_info["core_idx"], dst_info["core_idx"], w)
+        edge_buf.add(src_info["core_idx"], dst_info["core_idx"], w)
 
         src_micro = src_info["micro_indices"]
         dst_micro = dst_info["micro_indices"]
@@ -277,41 +666,675 @@ def main() -> None:
 
         bridges = max(1, min(8, int(round(1 + (w * 8)))))
         offset_seed = stable_seed(f"{src_name}|{dst_name}") % max(len(src_micro), 1)
-        for b in range(bridges):
-            ia = src_micro[(offset_seed + (b * len(src_micro) // bridges)) % len(src_micro)]
-            ib = dst_micro[((bridges - 1 - b) * len(dst_micro) // bridges) % len(dst_micro)]
-            add_edge(ia, ib, max(0.08, w * 0.66))
-
-    edges = []
-    for (s, t), w in sorted(edge_w.items()):
-        edges.append(
-            {
-                "source": s,
-                "target": t,
-                "weight_faces": int(round(w * 1000)),
-                "weight_norm": float(round(w, 6)),
-            }
-        )
+        b = np.arange(bridges)
+        ia = np.asarray(src_micro)[(offset_seed + (b * len(src_micro) // bridges)) % len(src_micro)]
+        ib = np.asarray(dst_micro)[((bridges - 1 - b) * len(dst_micro) // bridges) % len(dst_micro)]
+        edge_buf.add(ia, ib, max(0.08, w * 0.66))
 
-    out = {
-        "atlas": {
-            "name": "AAL",
-            "version": "SPM12",
-            "space": "MNI",
-            "mode": "dense_voxel_sample",
-            "source_nifti": str(atlas_path),
-            "target_nodes": int(args.target_nodes),
-        },
-        "nodes": nodes,
-        "edges": edges,
+
+def edge_weight_norms(edge_weight: np.ndarray) -> List[float]:
+    return [round(w, 6) for w in edge_weight.tolist()]
+
+
+def build_csr(
+    node_count: int, edge_src: np.ndarray, edge_dst: np.ndarray, edge_weight_norm: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Symmetric CSR adjacency (row_offsets, neighbors, weights), rows in edge order."""
+    src = np.asarray(edge_src, dtype=np.int64)
+    dst = np.asarray(edge_dst, dtype=np.int64)
+    edge_idx = np.arange(src.size, dtype=np.int64)
+    rows = np.concatenate([src, dst])
+    order = np.lexsort((np.concatenate([edge_idx, edge_idx]), rows))
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=node_count), out=offsets[1:])
+    neighbors = np.concatenate([dst, src])[order]
+    weights = np.tile(np.asarray(edge_weight_norm, dtype=np.float64), 2)[order]
+    return offsets, neighbors, weights
+
+
+def label_index(base_nodes: List[dict], region_info: Dict[str, dict]) -> Dict[str, List[int]]:
+    """Region name -> node indices (core first, then micro nodes, ascending)."""
+    return {
+        n["name"]: [region_info[n["name"]]["core_idx"]] + list(region_info[n["name"]]["micro_indices"])
+        for n in base_nodes
     }
 
-    out_path.write_text(json.dumps(out, separators=(",", ":")))
-    print(f"Wrote {out_path}")
+
+def write_graph_json(
+    path: Path,
+    head: dict,
+    nodes: List[dict],
+    edge_src: np.ndarray,
+    edge_dst: np.ndarray,
+    edge_weight: np.ndarray,
+    tail: dict | None = None,
+    csr: Tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+    edge_faces: np.ndarray | None = None,
+    chunk: int = 1 << 14,
+) -> None:
+    """Stream ``{**head, "nodes", "edges", "csr"?, **tail}`` as compact JSON, via a temp file."""
+    # Output bytes match json.dumps(..., separators=(",", ":")); edge_faces keeps the
+    # weight_faces of edges carried over from an existing file.
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    tmp = temp_path(path)
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(dumps(head)[:-1] + ',"nodes":[')
+        for start in range(0, len(nodes), chunk):
+            f.write(("," if start else "") + dumps(nodes[start : start + chunk])[1:-1])
+        f.write('],"edges":[')
+        for start in range(0, len(edge_src), chunk):
+            stop = start + chunk
+            weights = edge_weight[start:stop].tolist()
+            if edge_faces is None:
+                faces = [int(round(w * 1000)) for w in weights]
+            else:
+                faces = edge_faces[start:stop].tolist()
+            records = [
+                # float.__repr__ is what json uses for floats.
+                f'{{"source":{s},"target":{t},"weight_faces":{wf},'
+                f'"weight_norm":{float.__repr__(round(w, 6))}}}'
+                for s, t, wf, w in zip(edge_src[start:stop].tolist(), edge_dst[start:stop].tolist(), faces, weights)
+            ]
+            f.write(("," if start else "") + ",".join(records))
+        f.write("]")
+        if csr is not None:
+            for i, (key, values) in enumerate(zip(("row_offsets", "neighbors", "weights"), csr)):
+                f.write(("," + '"csr":{' if i == 0 else ",") + f'"{key}":[')
+                for start in range(0, len(values), chunk):
+                    f.write(("," if start else "") + dumps(values[start : start + chunk].tolist())[1:-1])
+                f.write("]")
+            f.write("}")
+        f.write("," + dumps(tail)[1:] if tail else "}")
+    os.replace(tmp, path)
+
+
+def nearest_indices(queries: np.ndarray, points: np.ndarray, pair_budget: int = 1 << 20) -> np.ndarray:
+    """Index of the nearest ``points`` row for every query (lowest index on ties)."""
+    out = np.empty(len(queries), dtype=np.int64)
+    step = max(1, pair_budget // max(1, len(points)))
+    for start in range(0, len(queries), step):
+        delta = queries[start:start + step, None, :] - points[None, :, :]
+        out[start:start + step] = np.einsum("ijk,ijk->ij", delta, delta).argmin(axis=1)
+    return out
+
+
+def assign_parents(fine_info: Dict[str, dict], coarse_info: Dict[str, dict], node_count: int) -> np.ndarray:
+    """Map each node to the nearest node of its region one level coarser (or its core node)."""
+    parents = np.empty(node_count, dtype=np.int64)
+    for name, info in fine_info.items():
+        coarse = coarse_info[name]
+        parents[info["core_idx"]] = coarse["core_idx"]
+        if not info["micro_indices"]:
+            continue
+        fine_idx = np.asarray(info["micro_indices"], dtype=np.int64)
+        if not coarse["micro_indices"]:
+            parents[fine_idx] = coarse["core_idx"]
+            continue
+        nearest = nearest_indices(
+            np.asarray(info["micro_coords"], dtype=np.float64),
+            np.asarray(coarse["micro_coords"], dtype=np.float64),
+        )
+        parents[fine_idx] = np.asarray(coarse["micro_indices"], dtype=np.int64)[nearest]
+    return parents
+
+
+def region_pair_edges(base_nodes: List[dict], base_edges: List[dict]) -> Dict[Tuple[str, str], List[tuple]]:
+    """Base edges grouped by unordered region pair, as sorted (source, target, weight) names."""
+    pairs: Dict[Tuple[str, str], List[tuple]] = {}
+    for e in base_edges:
+        src_name = base_nodes[e["source"]]["name"]
+        dst_name = base_nodes[e["target"]]["name"]
+        key = (src_name, dst_name) if src_name < dst_name else (dst_name, src_name)
+        pairs.setdefault(key, []).append((src_name, dst_name, float(e.get("weight_norm", 0.0))))
+    return {key: sorted(edges) for key, edges in pairs.items()}
+
+
+def region_info_from_nodes(nodes: List[dict]) -> Dict[str, dict]:
+    """Recover each region's core index and micro indices from a dense graph's nodes."""
+    region_info: Dict[str, dict] = {}
+    for idx, n in enumerate(nodes):
+        if n.get("kind") == "micro":
+            region_info[n["region"]]["micro_indices"].append(idx)
+        else:
+            region_info[n["name"]] = {"core_idx": idx, "micro_indices": []}
+    return region_info
+
+
+def patch_bridges(
+    prev_graph: dict,
+    old_base: dict,
+    new_base: dict,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, List[Tuple[str, str]]]:
+    """Rewire only the region pairs whose base edges differ between two base graphs."""
+    old_nodes = [(n["name"], n.get("id"), n.get("volume_mm3")) for n in old_base["nodes"]]
+    new_nodes = [(n["name"], n.get("id"), n.get("volume_mm3")) for n in new_base["nodes"]]
+    if old_nodes != new_nodes:
+        raise RuntimeError("Base graph nodes changed; incremental patching needs a full rebuild")
+
+    old_pairs = region_pair_edges(old_base["nodes"], old_base["edges"])
+    new_pairs = region_pair_edges(new_base["nodes"], new_base["edges"])
+    changed = sorted(key for key in old_pairs.keys() | new_pairs.keys() if old_pairs.get(key) != new_pairs.get(key))
+
+    nodes = prev_graph["nodes"]
+    region_info = region_info_from_nodes(nodes)
+    edges = prev_graph["edges"]
+    src = np.fromiter((e["source"] for e in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((e["target"] for e in edges), dtype=np.int64, count=len(edges))
+    weight = np.fromiter((e["weight_norm"] for e in edges), dtype=np.float64, count=len(edges))
+    faces = np.fromiter((e["weight_faces"] for e in edges), dtype=np.int64, count=len(edges))
+    if not changed:
+        return src, dst, weight, faces, changed
+
+    names = [n["name"] for n in new_base["nodes"]]
+    region_of = np.empty(len(nodes), dtype=np.int64)
+    for r, name in enumerate(names):
+        info = region_info[name]
+        region_of[info["core_idx"]] = r
+        region_of[info["micro_indices"]] = r
+    region_idx = {name: r for r, name in enumerate(names)}
+    pair_codes = np.asarray(
+        [min(region_idx[a], region_idx[b]) * len(names) + max(region_idx[a], region_idx[b]) for a, b in changed],
+        dtype=np.int64,
+    )
+    ra, rb = region_of[src], region_of[dst]
+    edge_codes = np.minimum(ra, rb) * len(names) + np.maximum(ra, rb)
+    keep = (ra == rb) | ~np.isin(edge_codes, pair_codes)
+
+    changed_set = set(changed)
+    rewired = [
+        e
+        for e in new_base["edges"]
+        if tuple(sorted((names[e["source"]], names[e["target"]]))) in changed_set
+    ]
+    edge_buf = EdgeBuffer(9 * len(rewired))
+    wire_bridges(edge_buf, new_base["nodes"], rewired, region_info)
+    new_src, new_dst, new_weight = edge_buf.reduce()
+
+    src = np.concatenate([src[keep], new_src])
+    dst = np.concatenate([dst[keep], new_dst])
+    weight = np.concatenate([weight[keep], np.asarray(edge_weight_norms(new_weight), dtype=np.float64)])
+    faces = np.concatenate(
+        [faces[keep], np.asarray([int(round(w * 1000)) for w in new_weight.tolist()], dtype=np.int64)]
+    )
+    order = np.lexsort((dst, src))
+    return src[order], dst[order], weight[order], faces[order], changed
+
+
+def level_path(out_path: Path, target_nodes: int) -> Path:
+    return out_path.with_name(f"{out_path.stem}_{target_nodes}{out_path.suffix}")
+
+
+def parse_levels(text: str) -> List[int]:
+    levels = sorted({int(part) for part in text.split(",") if part.strip()})
+    if not levels:
+        raise argparse.ArgumentTypeError("expected a comma-separated list of node targets")
+    return levels
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (since the last reset)."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows; the profiler reports no peak there.
+        return 0.0
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS watermark; False where that is unsupported."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageProfiler:
+    """Wall time, CPU time and peak RSS per generator stage (no-op when disabled)."""
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.stages: List[dict] = []
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str, **info):
+        if not self.enabled:
+            yield
+            return
+        per_stage = reset_peak_rss()
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append(
+                {
+                    "stage": name,
+                    **info,
+                    "wall_s": round(time.perf_counter() - wall0, 6),
+                    "cpu_s": round(time.process_time() - cpu0, 6),
+                    "peak_rss_mb": round(peak_rss_mb(), 1),
+                    "peak_rss_scope": "stage" if per_stage else "process",
+                }
+            )
+
+    def report(self, **meta) -> dict:
+        totals: Dict[str, dict] = {}
+        for rec in self.stages:
+            tot = totals.setdefault(rec["stage"], {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+            tot["wall_s"] = round(tot["wall_s"] + rec["wall_s"], 6)
+            tot["cpu_s"] = round(tot["cpu_s"] + rec["cpu_s"], 6)
+            tot["peak_rss_mb"] = max(tot["peak_rss_mb"], rec["peak_rss_mb"])
+        return {
+            **meta,
+            "wall_s": round(time.perf_counter() - self.started, 6),
+            "cpu_s": round(time.process_time() - self.started_cpu, 6),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "stages": self.stages,
+            "totals": totals,
+        }
+
+
+def write_profile(out_path: Path, report: dict) -> None:
+    profile_path = out_path.with_suffix(".profile.json")
+    write_atomic(profile_path, (json.dumps(report, indent=2) + "\n").encode("utf-8"))
+    print(f"Wrote {profile_path}")
+
+
+def write_outputs(
+    out_path: Path,
+    atlas_meta: dict,
+    base_nodes: List[dict],
+    nodes: List[dict],
+    edge_src: np.ndarray,
+    edge_dst: np.ndarray,
+    edge_weight: np.ndarray,
+    tail: dict,
+    csr: bool,
+    packed: bool,
+    parents: Sequence[int] | None = None,
+    edge_faces: np.ndarray | None = None,
+    note: str = "",
+) -> None:
+    weight_norms = edge_weight_norms(edge_weight) if csr or packed else None
+    csr_arrays = build_csr(len(nodes), edge_src, edge_dst, weight_norms) if csr else None
+    write_graph_json(
+        out_path,
+        {"atlas": atlas_meta},
+        nodes,
+        edge_src,
+        edge_dst,
+        edge_weight,
+        tail,
+        csr=csr_arrays,
+        edge_faces=edge_faces,
+    )
+    print(f"Wrote {out_path}{note}")
+    if packed:
+        bin_path, meta_path = write_packed_graph(
+            out_path,
+            atlas_meta,
+            base_nodes,
+            nodes,
+            edge_src,
+            edge_dst,
+            weight_norms,
+            parents=parents,
+            csr=csr_arrays,
+        )
+        print(f"Wrote {bin_path} ({bin_path.stat().st_size} bytes) + {meta_path.name}")
     print(f"Nodes: {len(nodes)}")
-    print(f"Edges: {len(edges)}")
+    print(f"Edges: {len(edge_src)}")
+
+
+def run_patch(args: argparse.Namespace, base_graph: dict, profiler: StageProfiler) -> None:
+    """Rewire the bridges of region pairs whose base edges changed in an existing dense graph."""
+    out_path = Path(args.out)
+    with profiler.stage("load_previous"):
+        prev_graph = json.loads(Path(args.patch_dense or out_path).read_text())
+        old_base = json.loads(Path(args.patch_from).read_text())
+    with profiler.stage("bridge_wiring"):
+        edge_src, edge_dst, edge_weight, edge_faces, changed = patch_bridges(prev_graph, old_base, base_graph)
+    nodes = prev_graph["nodes"]
+    tail = {}
+    if args.csr or "label_index" in prev_graph:
+        tail["label_index"] = label_index(base_graph["nodes"], region_info_from_nodes(nodes))
+    if "lod" in prev_graph:
+        tail["lod"] = prev_graph["lod"]
+    with profiler.stage("serialisation"):
+        write_outputs(
+            out_path,
+            prev_graph["atlas"],
+            base_graph["nodes"],
+            nodes,
+            edge_src,
+            edge_dst,
+            edge_weight,
+            tail,
+            csr="label_index" in tail,
+            packed=args.packed,
+            parents=[n["parent"] for n in nodes] if nodes and "parent" in nodes[0] else None,
+            edge_faces=edge_faces,
+            note=f" ({len(changed)} region pairs rewired)",
+        )
+    if args.profile:
+        write_profile(out_path, profiler.report(generator_version=GENERATOR_VERSION, mode="patch"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--base-graph",
+        default="model/assets/aal_graph.json",
+        help="Base 116-node graph JSON",
+    )
+    parser.add_argument(
+        "--atlas",
+        default=DEFAULT_ATLAS,
+        help="AAL atlas NIfTI path, or an AAL .tar.gz read in place "
+        f"(falls back to {DEFAULT_ATLAS_ARCHIVE} when the default NIfTI is absent)",
+    )
+    parser.add_argument(
+        "--labels",
+        default=DEFAULT_LABELS,
+        help="AAL labels CSV path (ignored when --atlas is an archive)",
+    )
+    parser.add_argument(
+        "--atlas-member",
+        default=ARCHIVE_ATLAS_MEMBER,
+        help="NIfTI member inside an atlas archive",
+    )
+    parser.add_argument(
+        "--labels-member",
+        default=ARCHIVE_LABELS_MEMBER,
+        help="Label table member inside an atlas archive",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".cache/stimflow",
+        help="Where decoded archive inputs, sampled node sets and build stamps are "
+        "cached ('' disables caching)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild even when the build cache says the outputs are up to date",
+    )
+    parser.add_argument(
+        "--out",
+        default="model/assets/aal_graph_dense.json",
+        help="Output dense graph JSON",
+    )
+    parser.add_argument(
+        "--target-nodes",
+        type=int,
+        default=3200,
+        help="Target total nodes including 116 core nodes",
+    )
+    parser.add_argument(
+        "--pyramid",
+        type=parse_levels,
+        help="Comma-separated node targets (e.g. 116,800,3200,12800); writes <out>_<n>.json "
+        "per level, each node linked to its parent one level coarser, from one atlas load",
+    )
+    parser.add_argument(
+        "--min-micro-per-region",
+        type=int,
+        default=8,
+        help="Minimum sampled micro nodes per region",
+    )
+    parser.add_argument(
+        "--knn",
+        type=int,
+        default=2,
+        help="Intra-region nearest neighbors per micro node",
+    )
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Also write a packed binary twin (<out>.bin + <out>.meta.json)",
+    )
+    parser.add_argument(
+        "--csr",
+        action="store_true",
+        help="Embed a CSR adjacency and a region label -> node indices table in the outputs",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes for per-region sampling and kNN (output is identical for any value)",
+    )
+    parser.add_argument(
+        "--slab-voxels",
+        type=int,
+        default=1 << 22,
+        help="Approximate voxels per atlas slab read while grouping labels (bounds peak memory)",
+    )
+    parser.add_argument(
+        "--patch-from",
+        help="Base graph the existing dense graph was built from; rewires only the bridges of "
+        "region pairs whose base edges changed, reusing its nodes and intra-region edges",
+    )
+    parser.add_argument(
+        "--patch-dense",
+        help="Existing dense graph to patch (default: --out)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write per-stage wall time, CPU time and peak RSS to <out>.profile.json "
+        "(always rebuilds)",
+    )
+    args = parser.parse_args()
+    if args.patch_from and args.pyramid:
+        parser.error("--patch-from does not support --pyramid")
+    profiler = StageProfiler(args.profile)
+
+    base_graph_path = Path(args.base_graph)
+    atlas_path = Path(args.atlas)
+    labels_path = Path(args.labels)
+    out_path = Path(args.out)
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+
+    base_graph = json.loads(base_graph_path.read_text())
+    base_nodes = base_graph["nodes"]
+    base_edges = base_graph["edges"]
+
+    if args.patch_from:
+        run_patch(args, base_graph, profiler)
+        return
+
+    if (
+        args.atlas == DEFAULT_ATLAS
+        and not atlas_path.exists()
+        and Path(DEFAULT_ATLAS_ARCHIVE).exists()
+    ):
+        atlas_path = Path(DEFAULT_ATLAS_ARCHIVE)
+    with profiler.stage("atlas_load"):
+        if is_archive(atlas_path):
+            img, label_to_code = load_archive_inputs(atlas_path, args.atlas_member, args.labels_member, cache_dir)
+            source_nifti = f"{atlas_path}:{args.atlas_member}"
+            atlas_key = [file_digest(atlas_path), args.atlas_member, args.labels_member]
+        else:
+            img = nib.load(str(atlas_path), keep_file_open=True)
+            label_to_code = load_label_map(labels_path)
+            source_nifti = str(atlas_path)
+            atlas_key = [file_digest(atlas_path), file_digest(labels_path)]
+
+    base_names = [n["name"] for n in base_nodes]
+    missing = [name for name in base_names if name not in label_to_code]
+    if missing:
+        raise RuntimeError(f"Missing label codes for: {missing[:8]}")
+
+    levels = args.pyramid or [args.target_nodes]
+    level_files = [level_path(out_path, t) for t in levels] if args.pyramid else [out_path]
+    outputs = list(level_files)
+    if args.packed:
+        outputs += [p for f in level_files for p in packed_paths(f)]
+    if args.pyramid:
+        outputs.append(out_path.with_suffix(".pyramid.json"))
+
+    # Content-addressed build cache: a stamp per full input set records the outputs
+    # it produced, and each level's sampled node set is cached separately so that
+    # wiring-only changes (e.g. --knn) skip the atlas scan and sampling.
+    build_key = digest_json(
+        {
+            "version": GENERATOR_VERSION,
+            "code": file_digest(Path(__file__)),
+            "atlas": atlas_key,
+            "source_nifti": source_nifti,
+            "base_graph": digest_json(base_graph),
+            "levels": levels,
+            "pyramid": bool(args.pyramid),
+            "min_micro_per_region": args.min_micro_per_region,
+            "knn": args.knn,
+            "packed": args.packed,
+            "csr": args.csr,
+            "outputs": [str(p) for p in outputs],
+        }
+    )
+    stamp_path = cache_dir / "builds" / f"{build_key}.json" if cache_dir else None
+    if stamp_path is not None and not (args.force or args.profile) and stamp_path.exists():
+        if json.loads(stamp_path.read_text()) == output_stamp(outputs):
+            print(f"Up to date: {out_path} (build {build_key[:12]})")
+            return
+
+    region_voxels: Dict[str, np.ndarray] | None = None
+    voxel_counts: Dict[str, int] | None = None
+    prev_info: Dict[str, dict] | None = None
+    manifest_levels = []
+    pool_context = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else nullcontext()
+    with pool_context as pool:
+        for level, (target_nodes, level_out) in enumerate(zip(levels, level_files)):
+            target_micro = max(0, target_nodes - len(base_nodes))
+            min_per_region = max(0, args.min_micro_per_region)
+            if args.pyramid:
+                # Coarse levels must stay coarse, so the per-region floor cannot exceed
+                # an even share of the level's budget.
+                min_per_region = min(min_per_region, target_micro // len(base_nodes))
+
+            sample_key = digest_json(
+                {
+                    "version": GENERATOR_VERSION,
+                    "atlas": atlas_key,
+                    "regions": base_names,
+                    "target_micro": target_micro,
+                    "min_per_region": min_per_region,
+                }
+            )
+            sample_path = cache_dir / "samples" / f"{sample_key}.npz" if cache_dir else None
+            region_coords = load_region_samples(sample_path, base_names) if sample_path else None
+            cached = region_coords is not None
+            if cached:
+                micro_alloc = {name: int(region_coords[name].shape[0]) for name in base_names}
+            else:
+                if region_voxels is None:
+                    with profiler.stage("voxel_grouping"):
+                        region_voxels, _ = load_region_voxels(img, label_to_code, base_names, args.slab_voxels)
+                    voxel_counts = {name: int(region_voxels[name].shape[0]) for name in base_names}
+                with profiler.stage("allocation", target_nodes=target_nodes):
+                    micro_alloc = allocate_micro_nodes(
+                        region_names=base_names,
+                        voxel_counts=voxel_counts,
+                        target_micro_total=target_micro,
+                        min_per_region=min_per_region,
+                    )
+            with profiler.stage("sampling", target_nodes=target_nodes, cached=cached):
+                if not cached:
+                    region_coords = sample_regions(base_nodes, region_voxels, img.affine, micro_alloc, pool)
+                    if sample_path is not None:
+                        save_region_samples(sample_path, base_names, region_coords)
+                nodes, region_info = sample_nodes(base_nodes, region_coords, micro_alloc)
+            with profiler.stage("intra_region_wiring", target_nodes=target_nodes):
+                region_knn = knn_tables(region_coords, args.knn, pool)
+                edge_buf = new_edge_buffer(region_info, region_knn, base_edges)
+                wire_intra_region(edge_buf, base_nodes, region_info, region_knn)
+            with profiler.stage("bridge_wiring", target_nodes=target_nodes):
+                wire_bridges(edge_buf, base_nodes, base_edges, region_info)
+            with profiler.stage("edge_materialisation", target_nodes=target_nodes):
+                edge_src, edge_dst, edge_weight = edge_buf.reduce()
+
+            parents = None
+            if prev_info is not None:
+                with profiler.stage("parent_mapping", target_nodes=target_nodes):
+                    parents = assign_parents(region_info, prev_info, len(nodes))
+                    for node, parent in zip(nodes, parents.tolist()):
+                        node["parent"] = parent
+            prev_info = region_info
+
+            atlas_meta = {
+                "name": "AAL",
+                "version": "SPM12",
+                "space": "MNI",
+                "mode": "dense_voxel_sample",
+                "source_nifti": source_nifti,
+                "target_nodes": int(target_nodes),
+            }
+            tail = {}
+            if args.csr:
+                tail["label_index"] = label_index(base_nodes, region_info)
+            if args.pyramid:
+                tail["lod"] = {
+                    "level": level,
+                    "levels": levels,
+                    "parent_graph": level_files[level - 1].name if level > 0 else None,
+                }
+
+            with profiler.stage("serialisation", target_nodes=target_nodes):
+                write_outputs(
+                    level_out,
+                    atlas_meta,
+                    base_nodes,
+                    nodes,
+                    edge_src,
+                    edge_dst,
+                    edge_weight,
+                    tail,
+                    csr=args.csr,
+                    packed=args.packed,
+                    parents=parents,
+                )
+            manifest_levels.append(
+                {
+                    "target_nodes": int(target_nodes),
+                    "file": level_out.name,
+                    "nodes": len(nodes),
+                    "edges": int(len(edge_src)),
+                }
+            )
+
+    if args.pyramid:
+        manifest_path = out_path.with_suffix(".pyramid.json")
+        manifest_path.write_text(json.dumps({"levels": manifest_levels}, indent=2) + "\n")
+        print(f"Wrote {manifest_path}")
+
+    if stamp_path is not None:
+        stamp_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(stamp_path, json.dumps(output_stamp(outputs)).encode("utf-8"))
+
+    if args.profile:
+        report = profiler.report(
+            generator_version=GENERATOR_VERSION,
+            levels=levels,
+            knn=args.knn,
+            workers=args.workers,
+            slab_voxels=args.slab_voxels,
+            cpu_scope="main process",
+        )
+        write_profile(out_path, report)
 
 
 if __name__ == "__main__":
     main()
-
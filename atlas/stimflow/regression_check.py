@@ -4,17 +4,31 @@
 Usage:
   python3 regression_check.py
   python3 regression_check.py --update
+  python3 regression_check.py --graph ../assets/aal_graph_dense.meta.json
+  python3 regression_check.py --full [--update] [--workers 8]
+  python3 regression_check.py --full --oracle
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
 import heapq
+import itertools
 import json
 import math
+import multiprocessing
+import os
 import pathlib
 import sys
-from typing import Dict, Iterable, List, Tuple
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # stdlib-only fallback; same results, per-edge loops
+    np = None
 
 
 DEFAULT_ENGAGEMENT = {
@@ -23,7 +37,11 @@ DEFAULT_ENGAGEMENT = {
     "coactivation_lag_s": 2.6,
 }
 DEFAULT_CORE_QUANTILE = 0.62
+SCHEMA_VERSION = 1
+ALGORITHM_VERSION = 2
 TRAVEL_WINDOW_S = 7.0
+PACKED_FORMAT = "stimflow-packed-graph"
+PACKED_TYPECODES = {"float64": "d", "float32": "f", "uint32": "I", "uint16": "H"}
 AAL_ALIASES = {
     "Frontal_Orb_Med": "Frontal_Med_Orb",
     "Frontal_Orb_Med_L": "Frontal_Med_Orb_L",
@@ -46,67 +64,343 @@ def edge_key(a: int, b: int) -> Tuple[int, int]:
     return (a, b) if a < b else (b, a)
 
 
-def quantile_cutoff(values: List[float], quantile: float) -> float:
-    if not values:
-        return math.inf
-    sorted_vals = sorted(values)
+def quantile_rank(count: int, quantile: float) -> int:
+    """Index of the ``quantile`` order statistic among ``count`` sorted values."""
     q = clamp01(quantile)
-    idx = min(len(sorted_vals) - 1, max(0, int(math.floor(q * (len(sorted_vals) - 1)))))
-    return sorted_vals[idx]
-
-
-def dijkstra_from(start_idx: int, adjacency: List[List[Tuple[int, float]]]) -> List[float]:
-    n = len(adjacency)
-    dist = [math.inf] * n
-    dist[start_idx] = 0.0
-    pq: List[Tuple[float, int]] = [(0.0, start_idx)]
-    while pq:
-        best, node = heapq.heappop(pq)
-        if best > dist[node]:
-            continue
-        for nb, w in adjacency[node]:
-            edge_cost = 1.0 / max(0.04, w)
-            cand = best + edge_cost
-            if cand < dist[nb]:
-                dist[nb] = cand
-                heapq.heappush(pq, (cand, nb))
-    return dist
-
-
-def multi_source_path(seed_indices: Iterable[int], adjacency: List[List[Tuple[int, float]]]) -> Tuple[List[float], List[int]]:
-    n = len(adjacency)
-    dist = [math.inf] * n
-    parent = [-1] * n
-    pq: List[Tuple[float, int]] = []
-    for idx in seed_indices:
-        if 0 <= idx < n:
-            dist[idx] = 0.0
-            heapq.heappush(pq, (0.0, idx))
-    while pq:
-        best, node = heapq.heappop(pq)
-        if best > dist[node]:
-            continue
-        for nb, w in adjacency[node]:
-            edge_cost = 1.0 / max(0.04, w)
-            cand = best + edge_cost
-            if cand < dist[nb]:
-                dist[nb] = cand
-                parent[nb] = node
-                heapq.heappush(pq, (cand, nb))
-    return dist, parent
+    return min(count - 1, max(0, int(math.floor(q * (count - 1)))))
+
+
+def quantile_cutoff(values: Sequence[float], quantile: float) -> float:
+    """The ``quantile_rank`` order statistic of ``values`` (``inf`` when empty)."""
+    if len(values) == 0:
+        return math.inf
+    k = quantile_rank(len(values), quantile)
+    if np is None:
+        return sorted(values)[k]
+    return float(np.partition(np.asarray(values, dtype=np.float64), k)[k])
+
+
+def edge_cost(weight: float) -> float:
+    return 1.0 / max(0.04, max(0.001, min(1.0, weight)))
+
+
+def load_packed_graph(meta_path: pathlib.Path) -> dict:
+    """Load a packed graph (``*.meta.json`` + ``*.bin``) as typed-array views."""
+    with meta_path.open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != PACKED_FORMAT:
+        raise ValueError(f"{meta_path} is not a {PACKED_FORMAT} sidecar")
+    payload = (meta_path.parent / meta["binary"]).read_bytes()
+    arrays = {}
+    for key, spec in meta["arrays"].items():
+        code = PACKED_TYPECODES[spec["dtype"]]
+        start = int(spec["offset"])
+        stop = start + int(spec["count"]) * array(code).itemsize
+        if sys.byteorder == "little":
+            arrays[key] = memoryview(payload)[start:stop].cast(code)
+        else:
+            swapped = array(code, payload[start:stop])
+            swapped.byteswap()
+            arrays[key] = swapped
+    return {
+        "atlas": meta.get("atlas", {}),
+        "graph_file": meta.get("graph_file", meta_path.name),
+        "node_count": int(meta["node_count"]),
+        "core_count": int(meta["core_count"]),
+        "regions": meta["regions"],
+        "arrays": arrays,
+    }
+
+
+def load_graph(path: pathlib.Path) -> dict:
+    if path.name.endswith(".meta.json"):
+        return load_packed_graph(path)
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def packed_node_ordinals(graph: dict) -> Sequence[int]:
+    """Per-node position among its region's micro nodes (1-based; 0 for core nodes)."""
+    core_count = graph["core_count"]
+    region = graph["arrays"]["region"]
+    if np is not None:
+        micro = np.asarray(region, dtype=np.int64)[core_count:]
+        order = np.argsort(micro, kind="stable")
+        counts = np.bincount(micro, minlength=len(graph["regions"]["name"]))
+        ordinal = np.zeros(graph["node_count"], dtype=np.int64)
+        ordinal[core_count + order] = np.arange(1, micro.size + 1) - (np.cumsum(counts) - counts)[micro[order]]
+        return ordinal
+    ordinal = array("q", bytes(8 * graph["node_count"]))
+    seen = [0] * len(graph["regions"]["name"])
+    for i in range(core_count, graph["node_count"]):
+        r = region[i]
+        seen[r] += 1
+        ordinal[i] = seen[r]
+    return ordinal
+
+
+def graph_edge_columns(graph: dict) -> Tuple[Sequence[int], Sequence[int], Sequence[float]]:
+    if "edges" in graph:
+        edges = graph["edges"]
+        return (
+            [int(edge["source"]) for edge in edges],
+            [int(edge["target"]) for edge in edges],
+            [float(edge.get("weight_norm", 0) or 0) for edge in edges],
+        )
+    arrays = graph["arrays"]
+    return arrays["source"], arrays["target"], arrays["weight_norm"]
+
+
+def graph_csr(graph: dict) -> Tuple[Sequence[int], Sequence[int], Sequence[float]] | None:
+    """Embedded CSR adjacency (row_offsets, neighbors, weights), if the graph has one."""
+    if "csr" in graph:
+        csr = graph["csr"]
+        return csr["row_offsets"], csr["neighbors"], csr["weights"]
+    arrays = graph.get("arrays") or {}
+    if "csr_offsets" in arrays:
+        return arrays["csr_offsets"], arrays["csr_neighbors"], arrays["csr_weights"]
+    return None
+
+
+def csr_from_edges(
+    node_count: int, edge_src: Sequence[int], edge_dst: Sequence[int], edge_w: Sequence[float]
+) -> Tuple[array, array, array]:
+    """Symmetric CSR (row_offsets, neighbors, weights); rows list neighbours in edge order."""
+    offsets = array("q", bytes(8 * (node_count + 1)))
+    for a, b in zip(edge_src, edge_dst):
+        offsets[a + 1] += 1
+        offsets[b + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+    fill = offsets[:-1]
+    neighbors = array("q", bytes(8 * offsets[-1]))
+    weights = array("d", bytes(8 * offsets[-1]))
+    for a, b, w in zip(edge_src, edge_dst, edge_w):
+        neighbors[fill[a]] = b
+        weights[fill[a]] = w
+        fill[a] += 1
+        neighbors[fill[b]] = a
+        weights[fill[b]] = w
+        fill[b] += 1
+    return offsets, neighbors, weights
+
 
+class GraphEngine:
+    """CSR view of one graph with precomputed edge costs, shared by every stimulus."""
 
-def build_label_index(graph_nodes: List[dict]) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+    def __init__(self, graph: dict) -> None:
+        if "nodes" in graph:
+            self._names: List[str] | None = [node.get("name", "") for node in graph["nodes"]]
+            self.node_count = len(self._names)
+        else:
+            # Packed graphs name micro nodes "<region>__NNN"; names are built only when read.
+            self._names = None
+            self._packed = graph
+            self._ordinals: Sequence[int] | None = None
+            self.node_count = int(graph["node_count"])
+        self.label_to_index, self.label_to_indices = graph_label_index(graph, self._names)
+        self.edge_src, self.edge_dst, self.edge_w = graph_edge_columns(graph)
+        csr = graph_csr(graph) or csr_from_edges(self.node_count, self.edge_src, self.edge_dst, self.edge_w)
+        self.offsets, self.neighbors, self.weights = csr
+        self.costs = array("d", map(edge_cost, self.weights))
+        self._pair_edges: Dict[Tuple[str, str], List[Tuple[int, int]]] | None = None
+        self._edge_slots: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        self._components: Tuple[List[int], List[int]] | None = None
+        self._edge_arrays = None
+
+    def name_of(self, idx: int) -> str:
+        if self._names is not None:
+            return self._names[idx]
+        graph = self._packed
+        region_name = graph["regions"]["name"][graph["arrays"]["region"][idx]]
+        if idx < graph["core_count"]:
+            return region_name
+        if self._ordinals is None:
+            self._ordinals = packed_node_ordinals(graph)
+        return f"{region_name}__{int(self._ordinals[idx]):03d}"
+
+    def _build_pair_index(self) -> Dict[Tuple[str, str], List[Tuple[int, int]]]:
+        label_of: List[str] = [""] * self.node_count
+        for label, indices in self.label_to_indices.items():
+            for idx in indices:
+                label_of[idx] = label
+        pair_edges: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        edge_slots = self._edge_slots
+        offsets, neighbors = self.offsets, self.neighbors
+        for a in range(self.node_count):
+            label_a = label_of[a]
+            lo = offsets[a]
+            for j, b in enumerate(neighbors[lo : offsets[a + 1]], lo):
+                label_b = label_of[b]
+                if label_b == label_a:
+                    continue
+                key = edge_key(a, b)
+                slots = edge_slots.get(key)
+                if slots is None:
+                    slots = edge_slots[key] = []
+                    pair = (label_a, label_b) if label_a < label_b else (label_b, label_a)
+                    pair_edges.setdefault(pair, []).append(key)
+                slots.append((a, j))
+        return pair_edges
+
+    def edges_between(self, label_a: str, label_b: str) -> List[Tuple[int, int]]:
+        """Edge keys joining nodes of two different canonical labels."""
+        if self._pair_edges is None:
+            self._pair_edges = self._build_pair_index()
+        pair = (label_a, label_b) if label_a < label_b else (label_b, label_a)
+        return self._pair_edges.get(pair, [])
+
+    def cost_overlay(self, edge_scale: Dict[Tuple[int, int], float]) -> Dict[int, Dict[int, float]]:
+        """Per-row slot costs for ``w * scale`` (clamped) on edges from ``edges_between``."""
+        overlay: Dict[int, Dict[int, float]] = {}
+        weights = self.weights
+        for key, scale in edge_scale.items():
+            for row, j in self._edge_slots[key]:
+                overlay.setdefault(row, {})[j] = edge_cost(weights[j] * scale)
+        return overlay
+
+    def edge_arrays(self):
+        """Edge (source, target, weight) as NumPy arrays, converted once."""
+        if self._edge_arrays is None:
+            self._edge_arrays = (
+                np.asarray(self.edge_src, dtype=np.int64),
+                np.asarray(self.edge_dst, dtype=np.int64),
+                np.asarray(self.edge_w, dtype=np.float64),
+            )
+        return self._edge_arrays
+
+    def component_sizes(self) -> Tuple[List[int], List[int]]:
+        """Connected component id per node and the size of each component."""
+        if self._components is None:
+            offsets, neighbors = self.offsets, self.neighbors
+            comp = [-1] * self.node_count
+            sizes: List[int] = []
+            for start in range(self.node_count):
+                if comp[start] >= 0:
+                    continue
+                cid = len(sizes)
+                comp[start] = cid
+                stack = [start]
+                size = 0
+                while stack:
+                    node = stack.pop()
+                    size += 1
+                    for nb in neighbors[offsets[node] : offsets[node + 1]]:
+                        if comp[nb] < 0:
+                            comp[nb] = cid
+                            stack.append(nb)
+                sizes.append(size)
+            self._components = (comp, sizes)
+        return self._components
+
+    def reachable_count(self, seed_indices: Iterable[int]) -> int:
+        comp, sizes = self.component_sizes()
+        return sum(sizes[c] for c in {comp[idx] for idx in seed_indices if 0 <= idx < self.node_count})
+
+    def shortest_paths(
+        self,
+        seed_indices: Iterable[int],
+        overlay: Dict[int, Dict[int, float]] | None = None,
+        settle_rank: int | None = None,
+        bound: float = math.inf,
+    ) -> Tuple[List[float], List[int], float]:
+        """Multi-source Dijkstra returning (dist, parent, cutoff), stopping at ``settle_rank`` when given."""
+        costs = self.costs
+        overlay = overlay or {}
+        offsets, neighbors = self.offsets, self.neighbors
+        n = self.node_count
+        dist = [math.inf] * n
+        parent = [-1] * n
+        settled = bytearray(n)
+        settled_count = 0
+        cutoff = math.inf
+        pq: List[Tuple[float, int]] = []
+        for idx in seed_indices:
+            if 0 <= idx < n:
+                dist[idx] = 0.0
+                heapq.heappush(pq, (0.0, idx))
+        while pq:
+            best, node = heapq.heappop(pq)
+            if settled[node] or best > dist[node]:
+                continue
+            if best > cutoff:
+                # Every node at distance <= cutoff is settled; put this one back.
+                heapq.heappush(pq, (best, node))
+                break
+            settled[node] = 1
+            if settled_count == settle_rank:
+                cutoff = best
+            settled_count += 1
+            row_costs = overlay.get(node)
+            for j in range(offsets[node], offsets[node + 1]):
+                nb = neighbors[j]
+                cand = best + (costs[j] if row_costs is None else row_costs.get(j, costs[j]))
+                if cand < dist[nb] and cand <= bound:
+                    dist[nb] = cand
+                    parent[nb] = node
+                    heapq.heappush(pq, (cand, nb))
+        if settle_rank is not None:
+            for _, node in pq:
+                if not settled[node]:
+                    dist[node] = math.inf
+                    parent[node] = -1
+        return dist, parent, cutoff
+
+    def arrival_paths(
+        self,
+        seed_indices: List[int],
+        quantile: float,
+        overlay: Dict[int, Dict[int, float]] | None = None,
+        bound: float = math.inf,
+    ) -> Tuple[List[float], List[int], float]:
+        """Search only up to the ``quantile`` cutoff of reachable arrival distances."""
+        reachable = self.reachable_count(seed_indices)
+        if reachable == 0:
+            return [math.inf] * self.node_count, [-1] * self.node_count, math.inf
+        return self.shortest_paths(seed_indices, overlay, quantile_rank(reachable, quantile), bound)
+
+
+def build_label_index(node_names: List[str]) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
     label_to_index: Dict[str, int] = {}
     label_to_indices: Dict[str, List[int]] = {}
-    for idx, node in enumerate(graph_nodes):
-        name = node.get("name", "")
+    for idx, name in enumerate(node_names):
         label_to_index[name] = idx
         canonical = canonical_label(name)
         label_to_indices.setdefault(canonical, []).append(idx)
     return label_to_index, label_to_indices
 
 
+def graph_label_index(
+    graph: dict, node_names: List[str] | None
+) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+    """``build_label_index`` from the graph's region table (or a packed graph's region column)."""
+    if "label_index" in graph:
+        table = graph["label_index"].items()
+    elif "label_nodes" in (graph.get("arrays") or {}):
+        offsets = graph["arrays"]["label_offsets"]
+        members = graph["arrays"]["label_nodes"]
+        table = ((name, members[offsets[r] : offsets[r + 1]]) for r, name in enumerate(graph["regions"]["name"]))
+    elif node_names is None:
+        # Packed graph without the table: group nodes by region (core nodes come first).
+        grouped: List[List[int]] = [[] for _ in graph["regions"]["name"]]
+        for i, r in enumerate(graph["arrays"]["region"]):
+            grouped[r].append(i)
+        table = zip(graph["regions"]["name"], grouped)
+    else:
+        return build_label_index(node_names)
+
+    label_to_index: Dict[str, int] = {}
+    label_to_indices: Dict[str, List[int]] = {}
+    for name, indices in table:
+        indices = list(indices)
+        if not indices:
+            continue
+        label_to_index[name] = indices[0]
+        canonical = canonical_label(name)
+        label_to_indices[canonical] = sorted(label_to_indices.get(canonical, []) + indices)
+    return label_to_index, label_to_indices
+
+
 def expand_seed(seed: dict, label_to_index: Dict[str, int]) -> List[Tuple[str, float]]:
     raw_label = canonical_label(seed.get("aal_label", ""))
     raw_weight = float(seed.get("w", seed.get("weight", 0)) or 0)
@@ -148,13 +442,11 @@ def normalize_path_pairs(raw_pairs: list, default_confidence: float) -> List[dic
     return out
 
 
-def apply_connectivity_for_stimulus(
+def connectivity_edge_scales(
     stimulus_id: str,
-    base_adjacency: List[List[Tuple[int, float]]],
-    edge_weight: Dict[Tuple[int, int], float],
-    label_to_indices: Dict[str, List[int]],
+    engine: GraphEngine,
     connectivity_spec: dict,
-) -> List[List[Tuple[int, float]]]:
+) -> Dict[Tuple[int, int], float]:
     edge_scale: Dict[Tuple[int, int], float] = {}
     global_pairs = connectivity_spec.get("global_pairs") or []
     stimulus_pairs = ((connectivity_spec.get("stimuli") or {}).get(stimulus_id) or {}).get("pairs") or []
@@ -169,80 +461,121 @@ def apply_connectivity_for_stimulus(
         scale = max(0.2, min(3.5, scale))
         if abs(scale - 1.0) < 1e-9:
             continue
-        from_indices = label_to_indices.get(from_label, [])
-        to_indices = label_to_indices.get(to_label, [])
-        for a in from_indices:
-            for b in to_indices:
-                if a == b:
-                    continue
-                key = edge_key(a, b)
-                if key not in edge_weight:
-                    continue
-                prev = edge_scale.get(key)
-                if prev is None or abs(scale - 1.0) > abs(prev - 1.0):
-                    edge_scale[key] = scale
-
-    out: List[List[Tuple[int, float]]] = []
-    for i, row in enumerate(base_adjacency):
-        next_row = []
-        for nb, w in row:
-            key = edge_key(i, nb)
-            scale = edge_scale.get(key, 1.0)
-            next_row.append((nb, max(0.001, min(1.0, w * scale))))
-        out.append(next_row)
-    return out
+        for key in engine.edges_between(from_label, to_label):
+            prev = edge_scale.get(key)
+            if prev is None or abs(scale - 1.0) > abs(prev - 1.0):
+                edge_scale[key] = scale
+    return edge_scale
 
 
-def path_snapshot_for_stimulus(stimulus: dict, graph: dict, connectivity_spec: dict) -> dict:
-    nodes = graph["nodes"]
-    edges = graph["edges"]
-    label_to_index, label_to_indices = build_label_index(nodes)
-    edge_weight: Dict[Tuple[int, int], float] = {}
-    base_adjacency: List[List[Tuple[int, float]]] = [[] for _ in nodes]
-    for edge in edges:
-        a = int(edge["source"])
-        b = int(edge["target"])
-        w = float(edge.get("weight_norm", 0) or 0)
-        base_adjacency[a].append((b, w))
-        base_adjacency[b].append((a, w))
-        edge_weight[edge_key(a, b)] = w
-
-    adjacency = apply_connectivity_for_stimulus(
-        stimulus_id=stimulus["id"],
-        base_adjacency=base_adjacency,
-        edge_weight=edge_weight,
-        label_to_indices=label_to_indices,
-        connectivity_spec=connectivity_spec,
-    )
+class DistanceOracle:
+    """Seed-to-all distance rows under the global pairs only, cached as ``<node>.npy`` (needs NumPy)."""
 
-    resolved_seeds: List[Tuple[str, float]] = []
-    for seed in stimulus.get("seed_regions") or []:
-        resolved_seeds.extend(expand_seed(seed, label_to_index))
+    def __init__(self, engine: GraphEngine, connectivity_spec: dict, directory: pathlib.Path | None = None) -> None:
+        self.engine = engine
+        self.directory = directory
+        self.edge_scale = connectivity_edge_scales("", engine, {"global_pairs": connectivity_spec.get("global_pairs")})
+        self.overlay = engine.cost_overlay(self.edge_scale)
+        offsets = np.asarray(engine.offsets, dtype=np.int64)
+        self.slot_row = np.repeat(np.arange(engine.node_count, dtype=np.int64), np.diff(offsets))
+        self.slot_nb = np.asarray(engine.neighbors, dtype=np.int64)
+        self.slot_cost = np.array(engine.costs, dtype=np.float64)
+        for slots in self.overlay.values():
+            for j, cost in slots.items():
+                self.slot_cost[j] = cost
+        self._rows: Dict[int, np.ndarray] = {}
 
-    seed_nodes: List[Tuple[int, float, List[float], float]] = []
-    seed_indices: List[int] = []
-    seed_set = set()
-    for label, weight in resolved_seeds:
-        idx = label_to_index.get(label)
-        if idx is None:
-            continue
-        dist = dijkstra_from(idx, adjacency)
-        max_dist = max([d for d in dist if math.isfinite(d)] or [1.0])
-        seed_nodes.append((idx, weight, dist, max(1.0, max_dist)))
-        seed_indices.append(idx)
-        seed_set.add(idx)
+    def row(self, node: int) -> np.ndarray:
+        row = self._rows.get(node)
+        if row is not None:
+            return row
+        path = self.directory / f"{node}.npy" if self.directory is not None else None
+        if path is not None and path.exists():
+            try:
+                row = np.load(path)
+            except (OSError, ValueError):
+                row = None
+            if row is not None and row.shape != (self.engine.node_count,):
+                row = None
+        if row is None:
+            dist, _parent, _cutoff = self.engine.shortest_paths([node], self.overlay)
+            row = np.asarray(dist, dtype=np.float64)
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                with tmp.open("wb") as f:
+                    np.save(f, row)
+                os.replace(tmp, path)
+        self._rows[node] = row
+        return row
 
-    if not seed_indices:
-        return {"reachable_nodes": 0, "core_edges": 0, "extended_edges": 0, "first12": []}
+    def distances(self, seed_indices: Sequence[int]) -> np.ndarray:
+        rows = [self.row(idx) for idx in sorted(set(seed_indices))]
+        return np.minimum.reduce(rows) if len(rows) > 1 else rows[0].copy()
 
-    dist, parent = multi_source_path(seed_indices, adjacency)
-    engagement = dict(DEFAULT_ENGAGEMENT)
-    engagement.update(stimulus.get("engagement") or {})
-    breadth_q = float(engagement.get("arrival_quantile", DEFAULT_ENGAGEMENT["arrival_quantile"]) or DEFAULT_ENGAGEMENT["arrival_quantile"])
-    finite_dist = [d for d in dist if math.isfinite(d)]
-    cutoff = quantile_cutoff(finite_dist, breadth_q)
+    def tree(self, dist: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Parent and parent CSR slot per node, as the search would assign them."""
+        # Costs are >= 1, so nodes settle in (distance, index) order and each keeps
+        # the first settled neighbour that reaches its final distance.
+        row, nb = self.slot_row, self.slot_nb
+        d_row = dist[row]
+        tight = np.flatnonzero(np.isfinite(d_row) & (d_row + self.slot_cost == dist[nb]))
+        tight = tight[np.lexsort((row[tight], d_row[tight], nb[tight]))]
+        tight_nb = nb[tight]
+        first = tight[np.concatenate([[True], tight_nb[1:] != tight_nb[:-1]])] if tight.size else tight
+        parent = np.full(self.engine.node_count, -1, dtype=np.int64)
+        slot = np.full(self.engine.node_count, -1, dtype=np.int64)
+        parent[nb[first]] = row[first]
+        slot[nb[first]] = first
+        return parent, slot
 
-    relevant = [False] * len(nodes)
+    def arrival_paths(self, seed_indices: Sequence[int], quantile: float) -> Tuple[np.ndarray, np.ndarray, float]:
+        """``GraphEngine.arrival_paths`` for base connectivity, by lookup."""
+        dist = self.distances(seed_indices)
+        cutoff = quantile_cutoff(dist[np.isfinite(dist)], quantile)
+        parent, _slot = self.tree(dist)
+        return dist, parent, cutoff
+
+    def cutoff_bound(self, seed_indices: Sequence[int], quantile: float, overlay: Dict[int, Dict[int, float]]) -> float:
+        """Upper bound on the arrival cutoff under ``overlay``, from the re-costed base tree."""
+        dist = self.distances(seed_indices)
+        reach = np.flatnonzero(np.isfinite(dist))
+        if not reach.size:
+            return math.inf
+        parent, slot = self.tree(dist)
+        diff = {j: cost - self.slot_cost[j] for slots in overlay.values() for j, cost in slots.items()}
+        upper = dist[reach]
+        recosted = np.zeros(self.slot_cost.size, dtype=bool)
+        recosted[list(diff)] = True
+        if recosted[slot[slot >= 0]].any():
+            # Push each re-costed tree edge's difference down to every descendant.
+            parents = parent.tolist()
+            slots = slot.tolist()
+            delta = [0.0] * self.engine.node_count
+            for v in reach[np.argsort(dist[reach], kind="stable")].tolist():
+                p = parents[v]
+                if p >= 0:
+                    delta[v] = delta[p] + diff.get(slots[v], 0.0)
+            upper = upper + np.asarray(delta)[reach]
+        bound = quantile_cutoff(upper, quantile)
+        return bound * (1.0 + 1e-9) + 1e-9
+
+
+def summarise_paths(
+    engine: GraphEngine,
+    dist: List[float],
+    parent: List[int],
+    cutoff: float,
+    seed_set: set,
+    core_q: float,
+    edge_min: float,
+    lag_max: float,
+    curated_core: List[Tuple[int, int]],
+    curated_extended: List[Tuple[int, int]],
+) -> dict:
+    """Relevance, tiers, arrival order and core/extended edge counts (pure Python)."""
+    n = engine.node_count
+    relevant = [False] * n
     max_relevant_dist = 0.0
     for i, d in enumerate(dist):
         if math.isfinite(d) and (d <= cutoff or i in seed_set):
@@ -250,11 +583,10 @@ def path_snapshot_for_stimulus(stimulus: dict, graph: dict, connectivity_spec: d
             max_relevant_dist = max(max_relevant_dist, d)
     dist_norm = max(0.1, max_relevant_dist)
 
-    core_q = float(stimulus.get("core_quantile", DEFAULT_CORE_QUANTILE) or DEFAULT_CORE_QUANTILE)
-    rel_dist = [dist[i] for i in range(len(nodes)) if relevant[i] and math.isfinite(dist[i])]
+    rel_dist = [dist[i] for i in range(n) if relevant[i] and math.isfinite(dist[i])]
     core_cutoff = quantile_cutoff(rel_dist, core_q)
-    tier = [0] * len(nodes)
-    arrival = [math.inf] * len(nodes)
+    tier = [0] * n
+    arrival = [math.inf] * n
     for i, d in enumerate(dist):
         if not relevant[i]:
             continue
@@ -268,12 +600,7 @@ def path_snapshot_for_stimulus(stimulus: dict, graph: dict, connectivity_spec: d
         key = edge_key(i, p)
         edge_meta[key] = "core" if (tier[i] == 2 and tier[p] == 2) else "extended"
 
-    edge_min = float(engagement.get("edge_weight_min", DEFAULT_ENGAGEMENT["edge_weight_min"]) or DEFAULT_ENGAGEMENT["edge_weight_min"])
-    lag_max = float(engagement.get("coactivation_lag_s", DEFAULT_ENGAGEMENT["coactivation_lag_s"]) or DEFAULT_ENGAGEMENT["coactivation_lag_s"])
-    for edge in edges:
-        a = int(edge["source"])
-        b = int(edge["target"])
-        w = float(edge.get("weight_norm", 0) or 0)
+    for a, b, w in zip(engine.edge_src, engine.edge_dst, engine.edge_w):
         if w < edge_min or not relevant[a] or not relevant[b]:
             continue
         if not math.isfinite(arrival[a]) or not math.isfinite(arrival[b]):
@@ -284,19 +611,11 @@ def path_snapshot_for_stimulus(stimulus: dict, graph: dict, connectivity_spec: d
         if key not in edge_meta:
             edge_meta[key] = "core" if (tier[a] == 2 and tier[b] == 2) else "extended"
 
-    for pair in normalize_path_pairs(stimulus.get("core_path") or [], 0.84):
-        for a in label_to_indices.get(pair["from"], []):
-            for b in label_to_indices.get(pair["to"], []):
-                key = edge_key(a, b)
-                if key in edge_weight:
-                    edge_meta[key] = "core"
-
-    for pair in normalize_path_pairs(stimulus.get("extended_path") or [], 0.58):
-        for a in label_to_indices.get(pair["from"], []):
-            for b in label_to_indices.get(pair["to"], []):
-                key = edge_key(a, b)
-                if key in edge_weight and key not in edge_meta:
-                    edge_meta[key] = "extended"
+    for key in curated_core:
+        edge_meta[key] = "core"
+    for key in curated_extended:
+        if key not in edge_meta:
+            edge_meta[key] = "extended"
 
     events = []
     for i, t in enumerate(arrival):
@@ -306,7 +625,7 @@ def path_snapshot_for_stimulus(stimulus: dict, graph: dict, connectivity_spec: d
     first12 = []
     for t, i in events[:12]:
         first12.append({
-            "aal_label": nodes[i].get("name", ""),
+            "aal_label": engine.name_of(i),
             "arrival_s": round(float(t), 3),
             "tier": "core" if tier[i] == 2 else "extended",
         })
@@ -321,44 +640,543 @@ def path_snapshot_for_stimulus(stimulus: dict, graph: dict, connectivity_spec: d
     }
 
 
-def build_snapshot(root: pathlib.Path) -> dict:
-    graph_path = root.parent / "assets" / "aal_graph_dense.json"
+def sorted_positions(sorted_keys, wanted: set):
+    """Positions in ``sorted_keys`` of the members of ``wanted`` that it contains."""
+    query = np.fromiter(wanted, dtype=np.int64, count=len(wanted))
+    pos = np.searchsorted(sorted_keys, query)
+    hit = pos < sorted_keys.size
+    hit[hit] = sorted_keys[pos[hit]] == query[hit]
+    return pos[hit]
+
+
+def summarise_paths_numpy(
+    engine: GraphEngine,
+    dist: List[float],
+    parent: List[int],
+    cutoff: float,
+    seed_set: set,
+    core_q: float,
+    edge_min: float,
+    lag_max: float,
+    curated_core: List[Tuple[int, int]],
+    curated_extended: List[Tuple[int, int]],
+) -> dict:
+    """``summarise_paths`` as whole-array operations over node and edge arrays."""
+    n = engine.node_count
+    src, dst, weight = engine.edge_arrays()
+    dist_a = np.asarray(dist, dtype=np.float64)
+    seed_mask = np.zeros(n, dtype=bool)
+    seed_mask[list(seed_set)] = True
+
+    relevant = np.isfinite(dist_a) & ((dist_a <= cutoff) | seed_mask)
+    rel_dist = dist_a[relevant]
+    dist_norm = max(0.1, max(0.0, float(rel_dist.max())) if rel_dist.size else 0.0)
+    core_cutoff = quantile_cutoff(rel_dist, core_q)
+
+    arrival = np.full(n, math.inf)
+    arrival[relevant] = (rel_dist / dist_norm) * TRAVEL_WINDOW_S
+    core_node = relevant & (seed_mask | (dist_a <= core_cutoff))
+
+    parent_a = np.asarray(parent, dtype=np.int64)
+    child = np.flatnonzero(relevant & (parent_a >= 0))
+    child = child[relevant[parent_a[child]]]
+    tree_lo = np.minimum(child, parent_a[child])
+    tree_hi = np.maximum(child, parent_a[child])
+
+    coact = (weight >= edge_min) & relevant[src] & relevant[dst]
+    coact[coact] = np.abs(arrival[src[coact]] - arrival[dst[coact]]) <= lag_max
+    co_lo = np.minimum(src[coact], dst[coact])
+    co_hi = np.maximum(src[coact], dst[coact])
+
+    # Sort + adjacent-dedupe rather than np.union1d/np.isin, which hash and are
+    # several times slower at these sizes.
+    keys = np.concatenate([tree_lo * n + tree_hi, co_lo * n + co_hi])
+    keys.sort()
+    keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+    key_core = core_node[keys // n] & core_node[keys % n]
+
+    core_set = {a * n + b for a, b in curated_core}
+    ext_set = {a * n + b for a, b in curated_extended} - core_set
+    uncurated = np.ones(keys.size, dtype=bool)
+    uncurated[sorted_positions(keys, core_set)] = False
+    core_edges = int(key_core[uncurated].sum()) + len(core_set)
+    extended_edges = int((~key_core[uncurated]).sum()) + len(ext_set) - sorted_positions(keys, ext_set).size
+
+    rel_idx = np.flatnonzero(relevant)
+    first = rel_idx[np.lexsort((rel_idx, arrival[rel_idx]))[:12]]
+    first12 = [
+        {
+            "aal_label": engine.name_of(i),
+            "arrival_s": round(float(arrival[i]), 3),
+            "tier": "core" if core_node[i] else "extended",
+        }
+        for i in first.tolist()
+    ]
+    return {
+        "reachable_nodes": int(rel_idx.size),
+        "core_edges": core_edges,
+        "extended_edges": extended_edges,
+        "first12": first12,
+    }
+
+
+def path_snapshot_for_stimulus(
+    stimulus: dict,
+    engine: GraphEngine,
+    connectivity_spec: dict,
+    oracle: DistanceOracle | None = None,
+) -> dict:
+    label_to_index = engine.label_to_index
+    edge_scale = connectivity_edge_scales(stimulus["id"], engine, connectivity_spec)
+    overlay = engine.cost_overlay(edge_scale)
+
+    resolved_seeds: List[Tuple[str, float]] = []
+    for seed in stimulus.get("seed_regions") or []:
+        resolved_seeds.extend(expand_seed(seed, label_to_index))
+
+    # Per-seed distance fields (the viewer's seed falloff) do not enter the
+    # snapshot, so only the multi-source search below is run.
+    seed_indices: List[int] = []
+    seed_set = set()
+    for label, _weight in resolved_seeds:
+        idx = label_to_index.get(label)
+        if idx is None:
+            continue
+        seed_indices.append(idx)
+        seed_set.add(idx)
+
+    if not seed_indices:
+        return {"reachable_nodes": 0, "core_edges": 0, "extended_edges": 0, "first12": []}
+
+    engagement = dict(DEFAULT_ENGAGEMENT)
+    engagement.update(stimulus.get("engagement") or {})
+    breadth_q = float(engagement.get("arrival_quantile", DEFAULT_ENGAGEMENT["arrival_quantile"]) or DEFAULT_ENGAGEMENT["arrival_quantile"])
+    # Nodes beyond the arrival cutoff are never relevant, so the search stops there.
+    if oracle is not None and edge_scale == oracle.edge_scale:
+        dist, parent, cutoff = oracle.arrival_paths(seed_indices, breadth_q)
+    else:
+        bound = oracle.cutoff_bound(seed_indices, breadth_q, overlay) if oracle is not None else math.inf
+        dist, parent, cutoff = engine.arrival_paths(seed_indices, breadth_q, overlay, bound)
+
+    core_q = float(stimulus.get("core_quantile", DEFAULT_CORE_QUANTILE) or DEFAULT_CORE_QUANTILE)
+    edge_min = float(engagement.get("edge_weight_min", DEFAULT_ENGAGEMENT["edge_weight_min"]) or DEFAULT_ENGAGEMENT["edge_weight_min"])
+    lag_max = float(engagement.get("coactivation_lag_s", DEFAULT_ENGAGEMENT["coactivation_lag_s"]) or DEFAULT_ENGAGEMENT["coactivation_lag_s"])
+    curated_core = [
+        key
+        for pair in normalize_path_pairs(stimulus.get("core_path") or [], 0.84)
+        for key in engine.edges_between(pair["from"], pair["to"])
+    ]
+    curated_extended = [
+        key
+        for pair in normalize_path_pairs(stimulus.get("extended_path") or [], 0.58)
+        for key in engine.edges_between(pair["from"], pair["to"])
+    ]
+    summarise = summarise_paths if np is None else summarise_paths_numpy
+    return summarise(
+        engine, dist, parent, cutoff, seed_set, core_q, edge_min, lag_max, curated_core, curated_extended
+    )
+
+
+def override_pair_scales(
+    connectivity_spec: dict,
+    stimulus_id: str,
+    overrides: Dict[Tuple[str, str], float],
+) -> dict:
+    """Connectivity spec where each overridden label pair has exactly the given scale."""
+
+    def pair_of(pair: dict) -> Tuple[str, str]:
+        a = canonical_label(pair.get("from") or pair.get("a") or pair.get("source"))
+        b = canonical_label(pair.get("to") or pair.get("b") or pair.get("target"))
+        return (a, b) if a < b else (b, a)
+
+    keys = {(a, b) if a < b else (b, a) for a, b in overrides}
+    stimuli = dict(connectivity_spec.get("stimuli") or {})
+    entry = dict(stimuli.get(stimulus_id) or {})
+    entry["pairs"] = [pair for pair in entry.get("pairs") or [] if pair_of(pair) not in keys] + [
+        {"from": a, "to": b, "scale": scale} for (a, b), scale in overrides.items()
+    ]
+    stimuli[stimulus_id] = entry
+    spec = dict(connectivity_spec)
+    spec["global_pairs"] = [pair for pair in spec.get("global_pairs") or [] if pair_of(pair) not in keys]
+    spec["stimuli"] = stimuli
+    return spec
+
+
+def sweep_pair_scales(
+    stimulus: dict,
+    engine: GraphEngine,
+    connectivity_spec: dict,
+    pair_grid: Dict[Tuple[str, str], Sequence[float]],
+    workers: int = 1,
+) -> List[dict]:
+    """Snapshot ``stimulus`` for every combination of scales in ``pair_grid``, sharing one engine."""
+    pairs = [(canonical_label(a), canonical_label(b)) for a, b in pair_grid]
+    wired = [bool(engine.edges_between(a, b)) for a, b in pairs]
+    variants = []
+    effective_keys = []
+    unique: Dict[Tuple[float, ...], int] = {}
+    for scales in itertools.product(*pair_grid.values()):
+        effective = tuple(max(0.2, min(3.5, float(scale))) for scale in scales)
+        key = tuple(scale if live else 1.0 for scale, live in zip(effective, wired))
+        if key not in unique:
+            unique[key] = len(unique)
+        variants.append(scales)
+        effective_keys.append(key)
+
+    stimulus_id = stimulus["id"]
+    specs = [override_pair_scales(connectivity_spec, stimulus_id, dict(zip(pairs, key))) for key in unique]
+    # Variants are cheap to ship but the engine is not, so only forked workers are used.
+    if workers <= 1 or len(specs) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        snaps = [path_snapshot_for_stimulus(stimulus, engine, spec) for spec in specs]
+    else:
+        _WORKER.update(engine=engine, stimulus=stimulus)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                snaps = list(pool.map(_variant_task, specs, chunksize=max(1, len(specs) // (4 * workers))))
+        finally:
+            _WORKER.clear()
+
+    return [
+        {"scales": [float(scale) for scale in scales], **snaps[unique[key]]}
+        for scales, key in zip(variants, effective_keys)
+    ]
+
+
+FULL_SUITE_FILES = ["stimuli.library.json", "stimuli.empirical.json"]
+_WORKER: dict = {}
+
+
+def _init_worker(graph_path: pathlib.Path, connectivity: dict) -> None:
+    # Forked workers inherit the parent's engine; spawned ones load the graph once.
+    if "engine" not in _WORKER:
+        _WORKER["engine"] = GraphEngine(load_graph(graph_path))
+        _WORKER["connectivity"] = connectivity
+
+
+def _snapshot_task(stimulus: dict) -> dict:
+    return path_snapshot_for_stimulus(stimulus, _WORKER["engine"], _WORKER["connectivity"], _WORKER.get("oracle"))
+
+
+def _variant_task(connectivity_spec: dict) -> dict:
+    return path_snapshot_for_stimulus(_WORKER["stimulus"], _WORKER["engine"], connectivity_spec)
+
+
+def graph_digest(graph_path: pathlib.Path) -> str:
+    """Content hash of a graph file (and its binary payload for packed graphs)."""
+    h = hashlib.sha256()
+    paths = [graph_path]
+    if graph_path.name.endswith(".meta.json"):
+        with graph_path.open("r", encoding="utf-8") as f:
+            paths.append(graph_path.parent / json.load(f)["binary"])
+    for path in paths:
+        with path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def code_digest() -> str:
+    """Hash of this script's source, so cached results never outlive the code that made them."""
+    return hashlib.sha256(pathlib.Path(__file__).read_bytes()).hexdigest()
+
+
+def graph_file_name(graph_path: pathlib.Path) -> str:
+    if graph_path.name.endswith(".meta.json"):
+        with graph_path.open("r", encoding="utf-8") as f:
+            return str(json.load(f).get("graph_file", graph_path.name))
+    return graph_path.name
+
+
+class SnapshotCache:
+    """Per-stimulus snapshots on disk, keyed by a hash of the graph, source and inputs they read."""
+
+    def __init__(self, directory: pathlib.Path | None, graph_key: str) -> None:
+        self.directory = directory
+        self.graph_key = graph_key
+        self.code_key = code_digest()
+
+    def key(self, stimulus: dict, connectivity_spec: dict) -> str:
+        entry = {
+            "schema_version": SCHEMA_VERSION,
+            "algorithm_version": ALGORITHM_VERSION,
+            "graph": self.graph_key,
+            "code": self.code_key,
+            "stimulus": stimulus,
+            "global_pairs": connectivity_spec.get("global_pairs") or [],
+            "connectivity": (connectivity_spec.get("stimuli") or {}).get(stimulus.get("id")),
+        }
+        return hashlib.sha256(json.dumps(entry, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        if self.directory is None:
+            return None
+        try:
+            with (self.directory / f"{key}.json").open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, snapshot: dict) -> None:
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{key}.json"
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(snapshot), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def snapshot_stimuli(
+    stimuli: List[dict],
+    get_engine: Callable[[], GraphEngine],
+    connectivity: dict,
+    graph_path: pathlib.Path,
+    workers: int = 1,
+    cache: SnapshotCache | None = None,
+    get_oracle: Callable[[], DistanceOracle] | None = None,
+) -> List[dict]:
+    """Snapshot each stimulus, reusing cached results and fanning the rest out over ``workers``."""
+    keys = [cache.key(stim, connectivity) for stim in stimuli] if cache else [None] * len(stimuli)
+    results = [cache.get(key) if cache else None for key in keys]
+    missing = [i for i, snap in enumerate(results) if snap is None]
+    if not missing:
+        return results
+
+    todo = [stimuli[i] for i in missing]
+    engine = get_engine()
+    oracle = get_oracle() if get_oracle is not None else None
+    if workers <= 1 or len(todo) <= 1:
+        computed = [path_snapshot_for_stimulus(stim, engine, connectivity, oracle) for stim in todo]
+    else:
+        _WORKER.update(engine=engine, connectivity=connectivity, oracle=oracle)
+        context = None
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(graph_path, connectivity),
+            ) as pool:
+                computed = list(pool.map(_snapshot_task, todo, chunksize=max(1, len(todo) // (4 * workers))))
+        finally:
+            _WORKER.clear()
+
+    for i, snap in zip(missing, computed):
+        results[i] = snap
+        if cache:
+            cache.put(keys[i], snap)
+    return results
+
+
+def build_snapshot(
+    root: pathlib.Path,
+    graph_path: pathlib.Path | None = None,
+    full: bool = False,
+    workers: int = 1,
+    cache_dir: pathlib.Path | None = None,
+    oracle: bool = False,
+) -> dict:
+    """Snapshot the four reference stimuli, or with ``full`` every stimulus of every suite file."""
+    graph_path = graph_path or root.parent / "assets" / "aal_graph_dense.json"
     stimuli_path = root / "stimuli.library.json"
     connectivity_path = root / "connectivity.empirical.json"
 
-    with graph_path.open("r", encoding="utf-8") as f:
-        graph = json.load(f)
-    with stimuli_path.open("r", encoding="utf-8") as f:
-        stimuli_lib = json.load(f)
+    engines: List[GraphEngine] = []
+
+    def get_engine() -> GraphEngine:
+        if not engines:
+            engines.append(GraphEngine(load_graph(graph_path)))
+        return engines[0]
+
+    cache = SnapshotCache(cache_dir, graph_digest(graph_path)) if cache_dir is not None else None
     with connectivity_path.open("r", encoding="utf-8") as f:
         connectivity = json.load(f)
 
-    target_ids = ["music", "pain", "fear", "reward"]
-    stimuli_by_id = {stim.get("id"): stim for stim in (stimuli_lib.get("stimuli") or [])}
+    get_oracle = None
+    if oracle and np is not None:
+        oracle_dir = None
+        if cache is not None:
+            oracle_key = {
+                "algorithm_version": ALGORITHM_VERSION,
+                "graph": cache.graph_key,
+                "code": cache.code_key,
+                "global_pairs": connectivity.get("global_pairs") or [],
+            }
+            digest = hashlib.sha256(json.dumps(oracle_key, sort_keys=True).encode("utf-8")).hexdigest()
+            oracle_dir = cache_dir / "oracle" / digest
+        oracles: List[DistanceOracle] = []
+
+        def get_oracle() -> DistanceOracle:
+            if not oracles:
+                oracles.append(DistanceOracle(get_engine(), connectivity, oracle_dir))
+            return oracles[0]
+
     result = {
-        "schema_version": 1,
-        "algorithm_version": 2,
-        "graph_file": str(graph_path.name),
-        "stimuli_file": str(stimuli_path.name),
-        "connectivity_file": str(connectivity_path.name),
-        "stimuli": {},
+        "schema_version": SCHEMA_VERSION,
+        "algorithm_version": ALGORITHM_VERSION,
+        "graph_file": graph_file_name(graph_path),
     }
-    for stim_id in target_ids:
-        stim = stimuli_by_id.get(stim_id)
-        if not stim:
-            continue
-        result["stimuli"][stim_id] = path_snapshot_for_stimulus(stim, graph, connectivity)
+    if full:
+        result["connectivity_file"] = str(connectivity_path.name)
+        result["suites"] = {}
+        for suite_file in FULL_SUITE_FILES:
+            with (root / suite_file).open("r", encoding="utf-8") as f:
+                stimuli = [stim for stim in (json.load(f).get("stimuli") or []) if stim.get("id")]
+            snapshots = snapshot_stimuli(stimuli, get_engine, connectivity, graph_path, workers, cache, get_oracle)
+            result["suites"][suite_file] = {stim["id"]: snap for stim, snap in zip(stimuli, snapshots)}
+        return result
+
+    with stimuli_path.open("r", encoding="utf-8") as f:
+        stimuli_lib = json.load(f)
+    target_ids = ["music", "pain", "fear", "reward"]
+    stimuli_by_id = {stim.get("id"): stim for stim in (stimuli_lib.get("stimuli") or [])}
+    result.update(
+        {
+            "stimuli_file": str(stimuli_path.name),
+            "connectivity_file": str(connectivity_path.name),
+            "stimuli": {},
+        }
+    )
+    stimuli = [stimuli_by_id[stim_id] for stim_id in target_ids if stimuli_by_id.get(stim_id)]
+    snapshots = snapshot_stimuli(stimuli, get_engine, connectivity, graph_path, workers, cache, get_oracle)
+    for stim, snap in zip(stimuli, snapshots):
+        result["stimuli"][stim["id"]] = snap
     return result
 
 
+_MISSING = object()
+Difference = Tuple[str, object, object]
+
+
+def diff_values(path: str, expected, actual, arrival_tol: float, out: List[Difference]) -> None:
+    """Append ``(path, expected, actual)`` for every differing leaf below ``path``.
+
+    ``arrival_s`` values within ``arrival_tol`` of each other count as equal.
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in list(expected) + [key for key in actual if key not in expected]:
+            diff_values(f"{path}/{key}", expected.get(key, _MISSING), actual.get(key, _MISSING), arrival_tol, out)
+    elif isinstance(expected, list) and isinstance(actual, list):
+        for i in range(max(len(expected), len(actual))):
+            diff_values(
+                f"{path}[{i}]",
+                expected[i] if i < len(expected) else _MISSING,
+                actual[i] if i < len(actual) else _MISSING,
+                arrival_tol,
+                out,
+            )
+    elif (
+        path.endswith("/arrival_s")
+        and isinstance(expected, (int, float))
+        and isinstance(actual, (int, float))
+    ):
+        if not abs(expected - actual) <= arrival_tol:
+            out.append((path, expected, actual))
+    elif expected != actual:
+        out.append((path, expected, actual))
+
+
+def snapshot_stimuli_map(snapshot: dict) -> Dict[str, dict]:
+    """Per-stimulus entries of a default (``stimuli``) or full (``suites``) snapshot, by path."""
+    entries = {f"stimuli/{stim_id}": snap for stim_id, snap in (snapshot.get("stimuli") or {}).items()}
+    for suite_file, suite in (snapshot.get("suites") or {}).items():
+        entries.update({f"suites/{suite_file}/{stim_id}": snap for stim_id, snap in suite.items()})
+    return entries
+
+
+def diff_snapshots(
+    expected: dict,
+    actual: dict,
+    arrival_tol: float = 0.0,
+    first_only: bool = False,
+) -> List[Difference]:
+    """Structured differences between two snapshots, header fields first, then per stimulus.
+
+    With ``first_only`` the walk stops after the first stimulus that differs.
+    """
+    out: List[Difference] = []
+    grouped = ("stimuli", "suites")
+    header = {key: value for key, value in expected.items() if key not in grouped}
+    diff_values("", header, {key: value for key, value in actual.items() if key not in grouped}, arrival_tol, out)
+    if out and first_only:
+        return out
+
+    expected_map = snapshot_stimuli_map(expected)
+    actual_map = snapshot_stimuli_map(actual)
+    for path in list(expected_map) + [path for path in actual_map if path not in expected_map]:
+        before = len(out)
+        diff_values(path, expected_map.get(path, _MISSING), actual_map.get(path, _MISSING), arrival_tol, out)
+        if first_only and len(out) > before:
+            break
+    return out
+
+
+def format_difference(diff: Difference, width: int = 160) -> str:
+    path, expected, actual = diff
+
+    def show(value) -> str:
+        if value is _MISSING:
+            return "<missing>"
+        text = json.dumps(value)
+        return text if len(text) <= width else text[: width - 3] + "..."
+
+    return f"  {path.lstrip('/')}: expected {show(expected)}, actual {show(actual)}"
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="StimFlow regression checker")
     parser.add_argument("--update", action="store_true", help="Write a new expected snapshot")
+    parser.add_argument("--graph", type=pathlib.Path, help="Graph JSON or packed *.meta.json to check")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Snapshot every stimulus in the library and empirical sets (regression.full.expected.json)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes sharing the loaded graph; worth raising for --full (default: 1)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Per-stimulus result cache (default: .cache/snapshots next to this script; '' disables). "
+        "Never read with --update",
+    )
+    parser.add_argument(
+        "--arrival-tol",
+        type=float,
+        default=0.0,
+        help="Treat arrival_s values within this many seconds as equal",
+    )
+    parser.add_argument(
+        "--first-diff",
+        action="store_true",
+        help="Stop comparing at the first stimulus that differs",
+    )
+    parser.add_argument("--max-diffs", type=int, default=50, help="Differences printed on failure")
+    parser.add_argument(
+        "--oracle",
+        action="store_true",
+        help="Look up base-connectivity stimuli in stored seed distance rows (slow to build once per graph)",
+    )
     args = parser.parse_args()
 
     root = pathlib.Path(__file__).resolve().parent
-    expected_path = root / "regression.expected.json"
-    snapshot = build_snapshot(root)
+    expected_path = root / ("regression.full.expected.json" if args.full else "regression.expected.json")
+    # --update always recomputes, so the expected file never inherits a cached result.
+    if args.update:
+        cache_dir = None
+    elif args.cache_dir is None:
+        cache_dir = root / ".cache" / "snapshots"
+    else:
+        cache_dir = pathlib.Path(args.cache_dir) if args.cache_dir else None
+    snapshot = build_snapshot(
+        root, args.graph, full=args.full, workers=args.workers, cache_dir=cache_dir, oracle=args.oracle
+    )
 
     if args.update or not expected_path.exists():
         expected_path.write_text(json.dumps(snapshot, indent=2) + "\n", encoding="utf-8")
@@ -366,13 +1184,14 @@ def main() -> int:
         return 0
 
     expected = json.loads(expected_path.read_text(encoding="utf-8"))
-    if snapshot != expected:
+    diffs = diff_snapshots(expected, snapshot, args.arrival_tol, args.first_diff)
+    if diffs:
         print("FAIL: regression snapshot mismatch")
         print("Run with --update to refresh expected snapshot if this change is intentional.")
-        print("Expected:")
-        print(json.dumps(expected, indent=2))
-        print("Actual:")
-        print(json.dumps(snapshot, indent=2))
+        for diff in diffs[: args.max_diffs]:
+            print(format_difference(diff))
+        if len(diffs) > args.max_diffs:
+            print(f"  ... and {len(diffs) - args.max_diffs} more")
         return 1
 
     print("PASS: regression snapshot matches expected")
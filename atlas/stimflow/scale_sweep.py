@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Connectivity scale sensitivity sweep for one StimFlow stimulus.
+
+Loads the graph once and snapshots the stimulus for every combination of
+scale values given for one or more label pairs, as if each combination had
+been written into connectivity.empirical.json. Each --pair replaces any global
+or per-stimulus entry for that pair (in either direction).
+
+Usage:
+  python3 scale_sweep.py music --pair Heschl_L:Temporal_Sup_L=0.6:2.0:0.1
+  python3 scale_sweep.py pain --pair Thalamus_L:Insula_L=0.8,1,1.2 \\
+      --pair Thalamus_R:Insula_R=0.8,1,1.2 --graph ../assets/aal_graph_dense.meta.json
+  python3 scale_sweep.py music --pair Heschl_L:Heschl_R=0.5,1,2 --json sweep.json --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import sys
+import time
+from typing import List, Tuple
+
+from regression_check import FULL_SUITE_FILES, GraphEngine, load_graph, sweep_pair_scales
+
+
+def parse_scales(text: str) -> List[float]:
+    """``a,b,c`` lists values; ``start:stop:step`` is an inclusive range."""
+    if text.count(":") == 2:
+        start, stop, step = (float(part) for part in text.split(":"))
+        if step <= 0 or stop < start:
+            raise argparse.ArgumentTypeError(f"bad scale range: {text}")
+        count = int(round((stop - start) / step)) + 1
+        return [round(start + i * step, 6) for i in range(count)]
+    values = [float(part) for part in text.split(",") if part.strip()]
+    if not values:
+        raise argparse.ArgumentTypeError("expected scale values")
+    return values
+
+
+def parse_pair(text: str) -> Tuple[Tuple[str, str], List[float]]:
+    labels, sep, scales = text.partition("=")
+    from_label, colon, to_label = labels.partition(":")
+    if not sep or not colon or not from_label or not to_label:
+        raise argparse.ArgumentTypeError(f"expected FROM:TO=SCALES, got {text!r}")
+    return (from_label, to_label), parse_scales(scales)
+
+
+def find_stimulus(root: pathlib.Path, stimulus_id: str) -> dict | None:
+    for suite_file in FULL_SUITE_FILES:
+        with (root / suite_file).open("r", encoding="utf-8") as f:
+            for stim in json.load(f).get("stimuli") or []:
+                if stim.get("id") == stimulus_id:
+                    return stim
+    return None
+
+
+def first_arrivals(first12: List[dict], count: int) -> str:
+    """Earliest non-seed arrivals as ``label@seconds``."""
+    later = [entry for entry in first12 if entry["arrival_s"] > 0][:count]
+    return " ".join(f"{entry['aal_label']}@{entry['arrival_s']:g}" for entry in later)
+
+
+def main() -> int:
+    root = pathlib.Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description="StimFlow connectivity scale sweep")
+    parser.add_argument("stimulus", help="Stimulus id from the library or empirical set")
+    parser.add_argument(
+        "--pair",
+        type=parse_pair,
+        action="append",
+        required=True,
+        help="FROM:TO=SCALES with SCALES as a,b,c or start:stop:step (repeatable)",
+    )
+    parser.add_argument("--graph", type=pathlib.Path, help="Graph JSON or packed *.meta.json")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Forked processes sharing the loaded graph (default: 1, in-process)",
+    )
+    parser.add_argument("--arrivals", type=int, default=3, help="First non-seed arrivals shown per row")
+    parser.add_argument("--json", type=pathlib.Path, help="Also write the full rows here")
+    args = parser.parse_args()
+
+    stimulus = find_stimulus(root, args.stimulus)
+    if stimulus is None:
+        print(f"unknown stimulus: {args.stimulus}", file=sys.stderr)
+        return 1
+    with (root / "connectivity.empirical.json").open("r", encoding="utf-8") as f:
+        connectivity = json.load(f)
+    pair_grid = dict(args.pair)
+
+    t0 = time.perf_counter()
+    engine = GraphEngine(load_graph(args.graph or root.parent / "assets" / "aal_graph_dense.json"))
+    t1 = time.perf_counter()
+    rows = sweep_pair_scales(stimulus, engine, connectivity, pair_grid, args.workers)
+    t2 = time.perf_counter()
+
+    headers = [f"{a}:{b}" for a, b in pair_grid] + ["reachable", "core", "extended", "first arrivals"]
+    table = [
+        [f"{scale:g}" for scale in row["scales"]]
+        + [str(row["reachable_nodes"]), str(row["core_edges"]), str(row["extended_edges"])]
+        + [first_arrivals(row["first12"], args.arrivals)]
+        for row in rows
+    ]
+    widths = [max(len(cell) for cell in column) for column in zip(headers, *table)]
+    for line in [headers] + table:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+    print(f"{len(rows)} variants in {t2 - t1:.2f}s (graph load {t1 - t0:.2f}s)", file=sys.stderr)
+
+    if args.json is not None:
+        payload = {
+            "stimulus": args.stimulus,
+            "pairs": [{"from": a, "to": b, "scales": scales} for (a, b), scales in pair_grid.items()],
+            "rows": rows,
+        }
+        args.json.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,6 +9,14 @@ const MILESTONE_LABEL = "VERITAS";
 const CACHE_BUST = `${CORE_BUILD_ID}-${STIMFLOW_BUILD_ID}`;
 
 const GRAPH_DENSE_URL = `../assets/aal_graph_dense.json?v=${CACHE_BUST}`;
+const GRAPH_DENSE_PACKED_URL = `../assets/aal_graph_dense.meta.json?v=${CACHE_BUST}`;
+const PACKED_GRAPH_FORMAT = "stimflow-packed-graph";
+const PACKED_ARRAY_TYPES = {
+  float64: Float64Array,
+  float32: Float32Array,
+  uint32: Uint32Array,
+  uint16: Uint16Array,
+};
 const GRAPH_URL = `../assets/aal_graph.json?v=${CACHE_BUST}`;
 const HULL_URL = `../assets/brain_hull.obj?v=${CACHE_BUST}`;
 const STIMULI_LIBRARY_URL = `./stimuli.library.json?v=${CACHE_BUST}`;
@@ -364,6 +372,63 @@ function edgeKey(a, b) {
   return a < b ? `${a}-${b}` : `${b}-${a}`;
 }
 
+// Symmetric CSR adjacency. Uses the graph's embedded `csr` (generate_dense_graph.py
+// --csr) when present; otherwise builds it with a counting sort, each row listing
+// neighbours in edge order.
+function graphAdjacencyCsr(g) {
+  const csr = g.csr;
+  if (csr?.row_offsets && csr?.neighbors && csr?.weights) {
+    return {
+      offsets: ArrayBuffer.isView(csr.row_offsets) ? csr.row_offsets : Uint32Array.from(csr.row_offsets),
+      neighbors: ArrayBuffer.isView(csr.neighbors) ? csr.neighbors : Uint32Array.from(csr.neighbors),
+      weights: ArrayBuffer.isView(csr.weights) ? csr.weights : Float64Array.from(csr.weights),
+    };
+  }
+
+  const n = g.nodes.length;
+  const offsets = new Uint32Array(n + 1);
+  for (const e of g.edges) {
+    offsets[e.source + 1]++;
+    offsets[e.target + 1]++;
+  }
+  for (let i = 0; i < n; i++) offsets[i + 1] += offsets[i];
+  const fill = offsets.slice(0, n);
+  const neighbors = new Uint32Array(offsets[n]);
+  const weights = new Float64Array(offsets[n]);
+  for (const e of g.edges) {
+    const w = Number(e.weight_norm) || 0;
+    neighbors[fill[e.source]] = e.target;
+    weights[fill[e.source]++] = w;
+    neighbors[fill[e.target]] = e.source;
+    weights[fill[e.target]++] = w;
+  }
+  return { offsets, neighbors, weights };
+}
+
+function hasEdge(a, b) {
+  if (!adjacencyCsr) return false;
+  const { offsets, neighbors } = adjacencyCsr;
+  for (let j = offsets[a]; j < offsets[a + 1]; j++) {
+    if (neighbors[j] === b) return true;
+  }
+  return false;
+}
+
+function scaledAdjacencyRow(i, edgeScaleMap) {
+  const { offsets, neighbors, weights } = adjacencyCsr;
+  const start = offsets[i];
+  const row = new Array(offsets[i + 1] - start);
+  for (let j = 0; j < row.length; j++) {
+    const to = neighbors[start + j];
+    const scale = edgeScaleMap ? (edgeScaleMap.get(edgeKey(i, to)) || 1) : 1;
+    row[j] = {
+      to,
+      w: THREE.MathUtils.clamp(weights[start + j] * scale, 0.001, 1.0),
+    };
+  }
+  return row;
+}
+
 function safeText(value, fallback = "") {
   if (typeof value === "string" && value.trim()) return value.trim();
   return fallback;
@@ -1164,6 +1229,7 @@ const requestedGraphMode = normalizeGraphMode(query.get("graph_mode"));
 const initialGraphMode = IS_TOUCH_DEVICE
   ? (requestedGraphMode === "auto" ? "dense" : requestedGraphMode)
   : (requestedGraphMode === "auto" ? "dense" : requestedGraphMode);
+const requestedGraphFormat = query.get("graph_format") === "packed" ? "packed" : "json";
 const initialBreadthQ = THREE.MathUtils.clamp(Number(query.get("path_breadth_q")) || DEFAULT_ENGAGEMENT.arrival_quantile, 0.60, 0.98);
 
 const ui = {
@@ -1449,10 +1515,9 @@ const nodeActivation = [];
 const compareNodeActivation = [];
 const nodeRelevant = [];
 const adjacency = [];
-const adjacencyBase = [];
+let adjacencyCsr = null; // { offsets, neighbors, weights } over graph.edges, rows in edge order
 const labelToIndex = new Map();
 const labelToIndices = new Map();
-const edgeKeySet = new Set();
 const connectivityByStimulus = new Map();
 const dummy = new THREE.Object3D();
 
@@ -3859,7 +3924,7 @@ function addNodes(g) {
 
   labelToIndex.clear();
   labelToIndices.clear();
-  edgeKeySet.clear();
+  const embeddedLabels = g.label_index && typeof g.label_index === "object";
 
   const c = new THREE.Color();
   for (let i = 0; i < g.nodes.length; i++) {
@@ -3881,11 +3946,12 @@ function addNodes(g) {
     nodeRelevant[i] = false;
     nodeArrival[i] = Infinity;
     adjacency[i] = [];
-    adjacencyBase[i] = [];
     labelToIndex.set(n.name, i);
-    const canonical = canonicalNodeLabel(n.name);
-    if (!labelToIndices.has(canonical)) labelToIndices.set(canonical, []);
-    labelToIndices.get(canonical).push(i);
+    if (!embeddedLabels) {
+      const canonical = canonicalNodeLabel(n.name);
+      if (!labelToIndices.has(canonical)) labelToIndices.set(canonical, []);
+      labelToIndices.get(canonical).push(i);
+    }
 
     dummy.position.copy(pos);
     dummy.scale.setScalar(baseScale);
@@ -3904,12 +3970,14 @@ function addNodes(g) {
     nodeSelectionMesh.setColorAt(i, new THREE.Color(0x000000));
   }
 
-  for (const e of g.edges) {
-    const w = Number(e.weight_norm) || 0;
-    adjacencyBase[e.source].push({ to: e.target, w });
-    adjacencyBase[e.target].push({ to: e.source, w });
-    edgeKeySet.add(edgeKey(e.source, e.target));
+  if (embeddedLabels) {
+    for (const [name, indices] of Object.entries(g.label_index)) {
+      const canonical = canonicalNodeLabel(name);
+      const merged = (labelToIndices.get(canonical) || []).concat(Array.from(indices));
+      labelToIndices.set(canonical, merged.sort((a, b) => a - b));
+    }
   }
+  adjacencyCsr = graphAdjacencyCsr(g);
 
   applyStimulusConnectivity(null);
 
@@ -4127,8 +4195,8 @@ function applyConnectivityPairsToEdgeMap(pairs, edgeScaleMap) {
     for (const fromIdx of fromIndices) {
       for (const toIdx of toIndices) {
         if (fromIdx === toIdx) continue;
+        if (!hasEdge(fromIdx, toIdx)) continue;
         const key = edgeKey(fromIdx, toIdx);
-        if (!edgeKeySet.has(key)) continue;
 
         const prev = edgeScaleMap.get(key);
         if (
@@ -4165,18 +4233,9 @@ function applyStimulusConnectivity(stimulusId) {
   activeConnectivityMap = edgeScaleMap;
   activeConnectivityEdgeCount = edgeScaleMap ? edgeScaleMap.size : 0;
 
-  for (let i = 0; i < adjacencyBase.length; i++) {
-    const baseRow = adjacencyBase[i] || [];
-    const activeRow = new Array(baseRow.length);
-    for (let j = 0; j < baseRow.length; j++) {
-      const nb = baseRow[j];
-      const scale = edgeScaleMap ? (edgeScaleMap.get(edgeKey(i, nb.to)) || 1) : 1;
-      activeRow[j] = {
-        to: nb.to,
-        w: THREE.MathUtils.clamp(nb.w * scale, 0.001, 1.0),
-      };
-    }
-    adjacency[i] = activeRow;
+  const n = adjacencyCsr ? adjacencyCsr.offsets.length - 1 : 0;
+  for (let i = 0; i < n; i++) {
+    adjacency[i] = scaledAdjacencyRow(i, edgeScaleMap);
   }
 
   updateConnectivityStatus();
@@ -4192,18 +4251,8 @@ function buildAdjacencyForStimulus(stimulusId) {
     stimulusId && connectivityByStimulus.get(stimulusId)
   ) || connectivityByStimulus.get("*") || null;
 
-  return adjacencyBase.map((baseRow, i) => {
-    const row = new Array(baseRow.length);
-    for (let j = 0; j < baseRow.length; j++) {
-      const nb = baseRow[j];
-      const scale = edgeScaleMap ? (edgeScaleMap.get(edgeKey(i, nb.to)) || 1) : 1;
-      row[j] = {
-        to: nb.to,
-        w: THREE.MathUtils.clamp(nb.w * scale, 0.001, 1.0),
-      };
-    }
-    return row;
-  });
+  const n = adjacencyCsr ? adjacencyCsr.offsets.length - 1 : 0;
+  return Array.from({ length: n }, (_, i) => scaledAdjacencyRow(i, edgeScaleMap));
 }
 
 function phaseAtTime(model, tSec) {
@@ -4247,8 +4296,8 @@ function addCuratedPairsToMeta(pairs, tier, edgeMeta) {
     for (const fromIdx of fromIndices) {
       for (const toIdx of toIndices) {
         if (fromIdx === toIdx) continue;
+        if (!hasEdge(fromIdx, toIdx)) continue;
         const key = edgeKey(fromIdx, toIdx);
-        if (!edgeKeySet.has(key)) continue;
         addPathEdgeMeta(edgeMeta, key, tier, pair.confidence, "curated");
       }
     }
@@ -5530,7 +5579,7 @@ async function loadGraph() {
 
   if (mode === "dense") {
     try {
-      return await fetchJson(GRAPH_DENSE_URL, "aal_graph_dense.json");
+      return await fetchDenseGraph();
     } catch (err) {
       console.warn("Dense graph unavailable, falling back to core graph:", err);
       return await fetchJson(GRAPH_URL, "aal_graph.json");
@@ -5538,13 +5587,99 @@ async function loadGraph() {
   }
 
   try {
-    return await fetchJson(GRAPH_DENSE_URL, "aal_graph_dense.json");
+    return await fetchDenseGraph();
   } catch (err) {
     console.warn("Dense graph unavailable, falling back to core graph:", err);
     return await fetchJson(GRAPH_URL, "aal_graph.json");
   }
 }
 
+async function fetchDenseGraph() {
+  if (requestedGraphFormat === "packed") {
+    try {
+      return await fetchPackedGraph(GRAPH_DENSE_PACKED_URL, "aal_graph_dense.meta.json");
+    } catch (err) {
+      console.warn("Packed dense graph unavailable, falling back to JSON:", err);
+    }
+  }
+  return await fetchJson(GRAPH_DENSE_URL, "aal_graph_dense.json");
+}
+
+async function fetchPackedGraph(metaUrl, label) {
+  const meta = await fetchJson(metaUrl, label);
+  if (meta?.format !== PACKED_GRAPH_FORMAT) throw new Error(`${label} is not ${PACKED_GRAPH_FORMAT}`);
+  const binUrl = new URL(meta.binary, new URL(metaUrl, window.location.href));
+  binUrl.searchParams.set("v", CACHE_BUST);
+  const r = await fetch(binUrl, { cache: "no-store" });
+  if (!r.ok) throw new Error(`${meta.binary} HTTP ${r.status}`);
+  return decodePackedGraph(meta, await r.arrayBuffer());
+}
+
+// Typed arrays are views straight over the fetched buffer (little-endian, as written
+// by generate_dense_graph.py --packed); node/edge records only wrap those views.
+function decodePackedGraph(meta, buffer) {
+  const arrays = {};
+  for (const [key, spec] of Object.entries(meta.arrays || {})) {
+    const ArrayType = PACKED_ARRAY_TYPES[spec.dtype];
+    if (!ArrayType) throw new Error(`packed graph: unsupported dtype ${spec.dtype}`);
+    arrays[key] = new ArrayType(buffer, spec.offset, spec.count);
+  }
+
+  const regions = meta.regions || {};
+  const regionNames = regions.name || [];
+  const coreCount = Number(meta.core_count) || 0;
+  const ordinal = new Uint32Array(regionNames.length);
+  const nodes = new Array(meta.node_count);
+  for (let i = 0; i < nodes.length; i++) {
+    const r = arrays.region[i];
+    const isCore = i < coreCount;
+    const name = isCore
+      ? regionNames[r]
+      : `${regionNames[r]}__${String(++ordinal[r]).padStart(3, "0")}`;
+    nodes[i] = {
+      idx: i,
+      id: isCore ? regions.id[r] : name,
+      name,
+      region: isCore ? undefined : regionNames[r],
+      mni_mm: arrays.mni_mm.subarray(i * 3, i * 3 + 3),
+      volume_mm3: arrays.volume_mm3[i],
+      hemisphere: regions.hemisphere?.[r] ?? "U",
+      kind: isCore ? "core" : "micro",
+    };
+    if (arrays.parent) nodes[i].parent = arrays.parent[i];
+  }
+
+  const edges = new Array(meta.edge_count);
+  for (let i = 0; i < edges.length; i++) {
+    const w = arrays.weight_norm[i];
+    edges[i] = {
+      source: arrays.source[i],
+      target: arrays.target[i],
+      weight_faces: Math.round(w * 1000),
+      weight_norm: w,
+    };
+  }
+
+  const graph = { atlas: meta.atlas || {}, nodes, edges, packed: arrays };
+  if (arrays.csr_offsets) {
+    graph.csr = {
+      row_offsets: arrays.csr_offsets,
+      neighbors: arrays.csr_neighbors,
+      weights: arrays.csr_weights,
+    };
+  }
+  if (arrays.label_nodes) {
+    graph.label_index = {};
+    for (let r = 0; r < regionNames.length; r++) {
+      graph.label_index[regionNames[r]] = arrays.label_nodes.subarray(
+        arrays.label_offsets[r],
+        arrays.label_offsets[r + 1]
+      );
+    }
+  }
+  return graph;
+}
+
 async function fetchJson(url, label) {
   const r = await fetch(url, { cache: "no-store" });
   if (!r.ok) throw new Error(`${label} HTTP ${r.status}`);